@@ -0,0 +1,274 @@
+import argparse
+import hashlib
+import json
+import os
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+
+import metrics
+from hlr_frame import to_compact_frame
+
+# Pre-aggregated dashboard metrics over HTTP/JSON, computed once per data version and filter and shared
+# by every viewer. Responses carry an ETag derived from the source's watermark, so a client that already
+# has the current version gets a 304 without the service touching MySQL or the snapshot.
+SERVICE_HOST = '127.0.0.1'
+SERVICE_PORT = 8502
+CACHE_SIZE = 256
+CLIENT_TIMEOUT = 10
+AGGREGATE_URL = os.environ.get('HLR_AGGREGATE_URL')
+FILTER_PARAMS = ('start', 'end', 'operation', 'file')
+
+def headline(status):
+    """Total, found and per-operation counts and the success rate, from (operation, hlr_found, count) rows."""
+    total = int(status['count'].sum())
+    found = int(status.loc[status['hlr_found'].astype(bool), 'count'].sum())
+    operations = status.groupby('operation', observed=True)['count'].sum()
+    return {'total': total, 'found': found, 'not_found': total - found,
+            'success_rate': found / total * 100 if total else 0.0,
+            'operations': {str(operation): int(count) for operation, count in operations.items()}}
+
+def frame_records(frame):
+    frame = frame.copy()
+    if 'recon_status' in frame.columns and isinstance(frame['recon_status'].dtype, pd.CategoricalDtype):
+        # The labels' codes are the stored status values, which to_compact_frame labels again on the client
+        frame['recon_status'] = frame['recon_status'].cat.codes
+    for column in frame.columns:
+        if isinstance(frame[column].dtype, pd.CategoricalDtype):
+            frame[column] = frame[column].astype(str)
+    return frame.to_dict('list')
+
+class SqlSource:
+    """get_summary's rollup queries, versioned by data_access's watermark (the ingest version)."""
+
+    name = 'sql'
+
+    def watermark(self):
+        import data_access
+        return data_access.get_watermark()
+
+    def summary(self, start_date=None, end_date=None, operation_filter=None, file_filter=None):
+        import data_access
+        # Straight to the queries: this service's own cache takes the place of data_access's
+        return data_access.get_summary.__wrapped__(start_date, end_date, operation_filter, file_filter)
+
+class FrameSource:
+    """Filtered aggregates over per-file, per-operation counts (hlr_frame.count_frame), as the cloud dashboard keeps.
+
+    signature() identifies the data version; load_counts() is only called again after it changes.
+    """
+
+    name = 'frame'
+
+    def __init__(self, signature=None, load_counts=None):
+        self.signature = signature or snapshot_signature
+        self.load_counts = load_counts or load_snapshot_counts
+        self._loaded = (None, None)
+        self._lock = threading.Lock()
+
+    def watermark(self):
+        return self.signature()
+
+    def summary(self, start_date=None, end_date=None, operation_filter=None, file_filter=None):
+        # The snapshot counts carry no dates, so a date range does not narrow them
+        watermark = self.watermark()
+        with self._lock:
+            if self._loaded[0] != watermark or self._loaded[1] is None:
+                self._loaded = (watermark, self.load_counts())
+            counts = self._loaded[1]
+        if operation_filter and operation_filter != 'All':
+            counts = counts[counts['operation'] == operation_filter]
+        if file_filter and file_filter != 'All' and 'file_name' in counts.columns:
+            counts = counts[counts['file_name'] == file_filter]
+        summary = {'status': counts.groupby(['operation', 'hlr_found'], observed=True)['count'].sum().reset_index()}
+        if 'file_name' in counts.columns:
+            summary['files'] = (counts.groupby('file_name', observed=True)['count'].sum()
+                                .sort_values(ascending=False).reset_index())
+        return summary
+
+def snapshot_signature():
+    from snapshot import manifest_signature
+    return manifest_signature()
+
+def load_snapshot_counts():
+    from snapshot import load_counts
+    return load_counts()
+
+def parse_filters(params):
+    # Query-string values as the positional (start_date, end_date, operation, file) the sources take
+    start, end, operation, file_name = (params.get(name) or None for name in FILTER_PARAMS)
+    return (date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None,
+            operation if operation != 'All' else None, file_name if file_name != 'All' else None)
+
+class AggregateService:
+    """Computes each (watermark, filter) payload once and serves it, with its ETag, from an LRU cache."""
+
+    def __init__(self, source, cache_size=CACHE_SIZE):
+        self.source = source
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._compute_lock = threading.Lock()
+
+    def etag(self, watermark, filters):
+        digest = hashlib.sha1(repr((self.source.name, watermark, filters)).encode('utf-8')).hexdigest()
+        return f'"{digest[:24]}"'
+
+    def _cached(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry:
+                self._cache.move_to_end(key)
+            return entry
+
+    def respond(self, params, if_none_match=None):
+        """(status, etag, body) for a request; 304 with no body when the client's copy is current."""
+        filters = parse_filters(params)
+        watermark = self.source.watermark()
+        etag = self.etag(watermark, filters)
+        if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+            metrics.count('aggregate_requests', status=304)
+            return 304, etag, b''
+        key = (watermark, filters)
+        entry = self._cached(key)
+        if entry is None:
+            # Viewers that all ask for a new version at once wait for the first one's result
+            with self._compute_lock:
+                entry = self._cached(key)
+                if entry is None:
+                    with metrics.timer('aggregate', source=self.source.name):
+                        summary = self.source.summary(*filters)
+                        payload = {'watermark': watermark, 'metrics': headline(summary['status']),
+                                   **{name: frame_records(frame) for name, frame in summary.items()}}
+                        entry = (etag, json.dumps(payload, default=str).encode('utf-8'))
+                    with self._lock:
+                        self._cache[key] = entry
+                        while len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+        metrics.count('aggregate_requests', status=200)
+        return 200, entry[0], entry[1]
+
+def make_handler(service):
+    class AggregateHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urllib.parse.urlsplit(self.path)
+            if url.path == '/health':
+                self.send_body(200, json.dumps({'source': service.source.name,
+                                                'watermark': service.source.watermark()}, default=str).encode('utf-8'))
+                return
+            if url.path != '/aggregates':
+                self.send_error(404)
+                return
+            params = dict(urllib.parse.parse_qsl(url.query))
+            try:
+                status, etag, body = service.respond(params, self.headers.get('If-None-Match'))
+            except ValueError as e:
+                self.send_error(400, str(e))
+                return
+            self.send_body(status, body, etag)
+
+        def send_body(self, status, body, etag=None):
+            self.send_response(status)
+            if etag:
+                self.send_header('ETag', etag)
+                # Clients may keep the body but must revalidate it, which costs the service one watermark check
+                self.send_header('Cache-Control', 'no-cache')
+            if status != 304:
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return AggregateHandler
+
+def summary_frames(payload):
+    # JSON records back into the compact frames the dashboards chart from
+    frames = {'metrics': payload['metrics']}
+    for name, records in payload.items():
+        if name in ('metrics', 'watermark'):
+            continue
+        frame = to_compact_frame(pd.DataFrame(records))
+        if 'date' in frame.columns:
+            frame['date'] = pd.to_datetime(frame['date']).dt.date
+        if 'hlr_found' in frame.columns:
+            frame['hlr_found'] = frame['hlr_found'].astype(bool)
+        frames[name] = frame
+    return frames
+
+class AggregateClient:
+    """Conditional requests to an aggregate service, keeping the last payload per filter to reuse on 304.
+
+    Pass base_url for a service running elsewhere, or service to call one in this process directly.
+    """
+
+    def __init__(self, base_url=None, service=None, timeout=CLIENT_TIMEOUT, cache_size=CACHE_SIZE):
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.service = service
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _request(self, params, etag):
+        if self.service is not None:
+            return self.service.respond(params, etag)
+        request = urllib.request.Request(f"{self.base_url}/aggregates?{urllib.parse.urlencode(params)}",
+                                         headers={'If-None-Match': etag} if etag else {})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.headers.get('ETag'), response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return 304, etag, b''
+            raise
+
+    def summary(self, start_date=None, end_date=None, operation_filter=None, file_filter=None):
+        """The service's aggregates for the filter: a 'metrics' dict plus one DataFrame per chart."""
+        params = {name: str(value) for name, value in zip(FILTER_PARAMS, (start_date, end_date, operation_filter,
+                                                                           file_filter))
+                  if value is not None and value != 'All'}
+        key = tuple(sorted(params.items()))
+        with self._lock:
+            cached = self._cache.get(key)
+        status, etag, body = self._request(params, cached[0] if cached else None)
+        if status == 304 and cached:
+            payload = cached[1]
+        else:
+            payload = json.loads(body)
+            with self._lock:
+                self._cache[key] = (etag, payload)
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return summary_frames(payload)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve pre-aggregated HLR dashboard metrics over HTTP/JSON")
+    parser.add_argument('--source', choices=('sql', 'snapshot'), default='sql',
+                        help="MySQL rollup (for app.py) or the cloud snapshot (for app_cloud.py) (default: %(default)s)")
+    parser.add_argument('--host', default=SERVICE_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help="port to listen on (default: %(default)s)")
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE,
+                        help="payloads kept across data versions and filters (default: %(default)s)")
+    args = parser.parse_args()
+
+    source = SqlSource() if args.source == 'sql' else FrameSource()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(AggregateService(source, args.cache_size)))
+    print(f"Serving {args.source} aggregates on http://{args.host}:{args.port}/aggregates")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
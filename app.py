@@ -1,10 +1,24 @@
 import streamlit as st
-import mysql.connector
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
+import os
+import time
 from datetime import datetime, timedelta
 
+import metrics
+from aggregate_service import AGGREGATE_URL, AggregateClient, AggregateService, SqlSource
+from data_access import (
+    EXPORT_COLUMNS, RECORD_COLUMNS, expire_watermark, get_file_names, get_records_page, get_repeat_failures,
+    get_subscriber_history, get_unique_counts, iter_data_chunks
+)
+import export
+from export import EXPORT_URL, MIME_TYPES, write_export
+from hlr_frame import hlr_status
+from live_monitor import fetch_state
+
+rerun_started = time.perf_counter()
+
 # Page config
 st.set_page_config(
     page_title="HLR Analytics Dashboard",
@@ -41,36 +55,6 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-def get_data(start_date=None, end_date=None, operation_filter=None, file_filter=None):
-    conn = mysql.connector.connect(
-        host='mysql',
-        user='hlruser',
-        password='hlrpass',
-        database='HLRDB'
-    )
-    
-    query = "SELECT * FROM hlr_verification WHERE 1=1"
-    params = []
-    
-    if start_date:
-        query += " AND DATE(record_timestamp) >= %s"
-        params.append(start_date)
-    if end_date:
-        query += " AND DATE(record_timestamp) <= %s"
-        params.append(end_date)
-    if operation_filter and operation_filter != 'All':
-        query += " AND operation = %s"
-        params.append(operation_filter)
-    if file_filter and file_filter != 'All':
-        query += " AND file_name = %s"
-        params.append(file_filter)
-    
-    query += " ORDER BY record_timestamp DESC"
-    
-    df = pd.read_sql(query, conn, params=params)
-    conn.close()
-    return df
-
 # Header
 st.markdown('<h1 class="main-header">📊 HLR Analytics Dashboard</h1>', unsafe_allow_html=True)
 
@@ -108,7 +92,7 @@ with st.sidebar:
     
     # File filter
     st.subheader("📁 File Filter")
-    unique_files = sorted(df['file_name'].unique(), reverse=True) if 'file_name' in df.columns else []
+    unique_files = get_file_names()
     file_filter = st.selectbox(
         "Select File",
         ["All"] + unique_files
@@ -116,54 +100,98 @@ with st.sidebar:
     
     # Refresh button
     if st.button("🔄 Refresh Data", type="primary"):
+        expire_watermark()
         st.rerun()
 
-# Load data
-df = get_data(start_date, end_date, operation_filter, file_filter)
+filters = (start_date, end_date, operation_filter, file_filter)
 
-if df.empty:
+@st.cache_resource
+def aggregate_client():
+    # One client per server process: the shared aggregate service if configured, otherwise one embedded here
+    if AGGREGATE_URL:
+        return AggregateClient(AGGREGATE_URL)
+    return AggregateClient(service=AggregateService(SqlSource()))
+
+# Load aggregates
+summary = aggregate_client().summary(*filters)
+daily_ops = summary['daily']
+status_data = summary['status']
+total_records = summary['metrics']['total']
+
+if total_records == 0:
     st.warning("⚠️ No data found for selected criteria")
     st.stop()
 
-# Convert timestamp
-df['record_timestamp'] = pd.to_datetime(df['record_timestamp'])
-df['date'] = df['record_timestamp'].dt.date
-df['hour'] = df['record_timestamp'].dt.hour
+with metrics.timer('aggregation', view='summary'):
+    status_data['hlr_status'] = hlr_status(status_data['hlr_found'])
+    status_data = status_data.sort_values(['operation', 'hlr_status'])
+    operation_totals = status_data.groupby('operation', as_index=False, observed=True)['count'].sum()
+    found_records = summary['metrics']['found']
 
 # Key Metrics
 st.subheader("📈 Key Metrics")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
+    today_count = int(daily_ops.loc[daily_ops['date'] == datetime.now().date(), 'count'].sum())
     st.metric(
         "📊 Total Records",
-        f"{len(df):,}",
-        delta=f"+{len(df[df['date'] == datetime.now().date()]):,} today"
+        f"{total_records:,}",
+        delta=f"+{today_count:,} today"
     )
 
 with col2:
-    simreg_count = len(df[df['operation'] == 'SIMREG'])
+    simreg_count = summary['metrics']['operations'].get('SIMREG', 0)
     st.metric("📱 SIMREG", f"{simreg_count:,}")
 
 with col3:
-    change_count = len(df[df['operation'] == 'CHANGEMSISDN'])
+    change_count = summary['metrics']['operations'].get('CHANGEMSISDN', 0)
     st.metric("🔄 CHANGEMSISDN", f"{change_count:,}")
 
 with col4:
-    success_rate = len(df[~df['hlr_msisdn'].str.contains('NO DATA FOUND', na=False)]) / len(df) * 100
+    success_rate = summary['metrics']['success_rate']
     st.metric("✅ Success Rate", f"{success_rate:.1f}%")
 
+# Live success rate, read from the ingesting process's monitor rather than MySQL
+live = fetch_state()
+if live and 'all' in live['series']:
+    st.subheader("🔴 Live Success Rate")
+    overall = live['series']['all']
+    baseline = overall[live['windows'][-1]]['success_rate']
+    for col, window in zip(st.columns(len(live['windows'])), live['windows']):
+        rate = overall[window]['success_rate']
+        with col:
+            st.metric(
+                f"Last {window}",
+                f"{rate:.1%}" if rate is not None else "–",
+                delta=f"{(rate - baseline) * 100:+.1f} pts vs {live['windows'][-1]}"
+                if rate is not None and baseline is not None and window != live['windows'][-1] else None
+            )
+    for key in live['alerting']:
+        st.error(f"🚨 {key}: success rate dropped over the last {live['windows'][0]}")
+    live_rows = pd.DataFrame([
+        {'series': key, **{f"{window} rate": state[window]['success_rate'] for window in live['windows']},
+         **{f"{window} not found": state[window]['not_found'] for window in live['windows']}}
+        for key, state in live['series'].items() if key.startswith(('operation:', 'source:'))
+    ])
+    if not live_rows.empty:
+        st.dataframe(live_rows, use_container_width=True, hide_index=True)
+    if live['alerts']:
+        with st.expander(f"Recent alerts ({len(live['alerts'])})"):
+            st.dataframe(pd.DataFrame(live['alerts'][::-1]), use_container_width=True, hide_index=True)
+    st.caption(f"Live counters as of {live['as_of']}")
+
 # Charts Section
 st.subheader("📊 Analytics")
 
 tab1, tab2, tab3, tab4 = st.tabs(["📈 Trends", "🥧 Distribution", "⏰ Hourly Pattern", "📋 Data Quality"])
 
-with tab1:
+with tab1, metrics.timer('chart_build', tab='trends'):
     col1, col2 = st.columns(2)
     
     with col1:
         # Daily trend
-        daily_data = df.groupby('date').size().reset_index(name='count')
+        daily_data = daily_ops.groupby('date', as_index=False, observed=True)['count'].sum()
         fig_trend = px.line(
             daily_data, x='date', y='count',
             title="📈 Daily Transaction Trend",
@@ -174,21 +202,20 @@ with tab1:
     
     with col2:
         # Operation trend
-        op_daily = df.groupby(['date', 'operation']).size().reset_index(name='count')
         fig_op_trend = px.line(
-            op_daily, x='date', y='count', color='operation',
+            daily_ops, x='date', y='count', color='operation',
             title="🔄 Operations Trend",
             color_discrete_sequence=['#667eea', '#764ba2']
         )
         st.plotly_chart(fig_op_trend, use_container_width=True)
 
-with tab2:
+with tab2, metrics.timer('chart_build', tab='distribution'):
     col1, col2 = st.columns(2)
     
     with col1:
         # Operation distribution
         fig_pie = px.pie(
-            df, names='operation',
+            operation_totals, names='operation', values='count',
             title="⚙️ Operation Distribution",
             color_discrete_sequence=['#667eea', '#764ba2']
         )
@@ -196,22 +223,18 @@ with tab2:
     
     with col2:
         # HLR data availability
-        df['hlr_status'] = df['hlr_msisdn'].apply(
-            lambda x: 'Data Found' if 'NO DATA FOUND' not in str(x) else 'No Data Found'
-        )
         fig_status = px.bar(
-            df.groupby(['operation', 'hlr_status']).size().reset_index(name='count'),
+            status_data,
             x='operation', y='count', color='hlr_status',
             title="📊 HLR Data Availability by Operation",
             color_discrete_sequence=['#28a745', '#dc3545']
         )
         st.plotly_chart(fig_status, use_container_width=True)
 
-with tab3:
+with tab3, metrics.timer('chart_build', tab='hourly'):
     # Hourly pattern
-    hourly_data = df.groupby('hour').size().reset_index(name='count')
     fig_hourly = px.bar(
-        hourly_data, x='hour', y='count',
+        summary['hourly'], x='hour', y='count',
         title="⏰ Hourly Transaction Pattern",
         color_discrete_sequence=['#667eea']
     )
@@ -219,14 +242,13 @@ with tab3:
     fig_hourly.update_yaxes(title="Transaction Count")
     st.plotly_chart(fig_hourly, use_container_width=True)
 
-with tab4:
+with tab4, metrics.timer('chart_build', tab='data_quality'):
     col1, col2 = st.columns(2)
     
     with col1:
         # File distribution
-        file_data = df.groupby('file_name').size().reset_index(name='count').sort_values('count', ascending=False)
         fig_files = px.bar(
-            file_data.head(10), x='count', y='file_name',
+            summary['files'], x='count', y='file_name',
             title="📁 Top 10 Files by Record Count",
             orientation='h',
             color_discrete_sequence=['#667eea']
@@ -235,43 +257,152 @@ with tab4:
     
     with col2:
         # Data quality metrics
+        exact_counts = st.checkbox("Exact distinct counts", help="Count distinct values over the rows instead of "
+                                   "merging the hourly sketches (slower on long ranges)")
+        (unique_bss_msisdn, unique_bss_imsi, unique_hlr_msisdn), error = get_unique_counts(*filters, exact=exact_counts)
+        approx = "≈ " if error else ""
         quality_metrics = {
-            'Total Records': len(df),
-            'Records with HLR Data': len(df[df['hlr_status'] == 'Data Found']),
-            'Records without HLR Data': len(df[df['hlr_status'] == 'No Data Found']),
-            'Unique BSS MSISDN': df['bss_msisdn'].nunique(),
-            'Unique BSS IMSI': df['bss_imsi'].nunique(),
-            'Unique HLR MSISDN': df[df['hlr_status'] == 'Data Found']['hlr_msisdn'].nunique() if len(df[df['hlr_status'] == 'Data Found']) > 0 else 0
+            'Total Records': f"{total_records:,}",
+            'Records with HLR Data': f"{found_records:,}",
+            'Records without HLR Data': f"{total_records - found_records:,}",
+            'Unique BSS MSISDN': f"{approx}{unique_bss_msisdn:,}",
+            'Unique BSS IMSI': f"{approx}{unique_bss_imsi:,}",
+            'Unique HLR MSISDN': f"{approx}{unique_hlr_msisdn:,}"
         }
         
         st.markdown("### 📋 Data Quality Summary")
         for metric, value in quality_metrics.items():
-            st.metric(metric, f"{value:,}")
+            st.metric(metric, value)
+        if error:
+            st.caption(f"Unique counts are HyperLogLog estimates, typically within ±{error:.1%} "
+                       f"(±{2 * error:.1%} for 95% of ranges)")
+
+    col1, col2 = st.columns(2)
+
+    with col1:
+        # BSS vs HLR reconciliation, classified at ingest
+        fig_recon = px.bar(
+            summary['recon'].sort_values('recon_status'), x='operation', y='count', color='recon_status',
+            title="🧮 BSS vs HLR Reconciliation by Operation",
+            color_discrete_sequence=['#28a745', '#dc3545', '#fd7e14', '#764ba2']
+        )
+        st.plotly_chart(fig_recon, use_container_width=True)
+
+    with col2:
+        st.markdown("### 🔁 Repeated Failures")
+        repeat_failures = get_repeat_failures()
+        if repeat_failures.empty:
+            st.info("No subscriber has failed reconciliation more than once")
+        else:
+            st.dataframe(repeat_failures, use_container_width=True, height=350)
+
+# Subscriber Search
+st.subheader("🔎 Subscriber Search")
+col1, col2 = st.columns([4, 1])
+with col1:
+    search_number = st.text_input("MSISDN or IMSI", placeholder="e.g. 60105160980 or 502195539415819")
+with col2:
+    search_prefix = st.checkbox("Prefix match")
+
+if search_number.strip():
+    try:
+        history = get_subscriber_history(search_number.strip(), search_prefix)
+    except ValueError as e:
+        st.error(str(e))
+    else:
+        if history.empty:
+            st.info("No verifications found for this subscriber")
+        else:
+            st.caption(f"{len(history):,} verifications across {history['file_name'].nunique()} files, newest first")
+            st.dataframe(history, use_container_width=True)
 
 # Recent Records
 st.subheader("🕒 Recent Records")
-recent_df = df.sort_values('file_name', ascending=False).head(20)[['record_timestamp', 'operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi', 'file_name']]
+shown_columns = st.multiselect("Columns", list(RECORD_COLUMNS), default=list(RECORD_COLUMNS))
+
+# One cursor per page visited, so Previous is a stack pop; start over whenever the filters change
+if st.session_state.get('records_filters') != filters:
+    st.session_state['records_filters'] = filters
+    st.session_state['page_cursors'] = [None]
+page_cursors = st.session_state['page_cursors']
+
+recent_df, next_cursor = get_records_page(*filters, columns=tuple(shown_columns), after=page_cursors[-1])
 st.dataframe(recent_df, use_container_width=True)
 
+col1, col2, col3 = st.columns([1, 1, 4])
+with col1:
+    if st.button("⬅️ Previous", disabled=len(page_cursors) == 1):
+        page_cursors.pop()
+        st.rerun()
+with col2:
+    if st.button("Next ➡️", disabled=next_cursor is None):
+        page_cursors.append(next_cursor)
+        st.rerun()
+with col3:
+    st.caption(f"Page {len(page_cursors)}")
+
+@st.cache_resource
+def export_server():
+    return export.serve()
+
 # Export functionality
 st.subheader("💾 Export Data")
 col1, col2 = st.columns(2)
 
 with col1:
-    if st.button("📥 Download Filtered Data (CSV)"):
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name=f"hlr_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
+    export_format = st.radio("Format", ["CSV", "Parquet"], horizontal=True).lower()
+    if st.button("📥 Export Filtered Data"):
+        progress_bar = st.progress(0.0, text="Exporting...")
+        export_path, exported = write_export(
+            iter_data_chunks(*filters), EXPORT_COLUMNS, export_format, total_rows=total_records,
+            progress=lambda done, total: progress_bar.progress(
+                min(done / total, 1.0), text=f"Exported {done:,} of {total:,} rows"
+            )
         )
+        progress_bar.progress(1.0, text=f"Exported {exported:,} rows")
+        if EXPORT_URL:
+            # Streamed from disk by the export server, so the dashboard never holds the file
+            export_server()
+            st.markdown(f"[⬇️ Download {export_format.upper()}]({EXPORT_URL.rstrip('/')}/{os.path.basename(export_path)})")
+        else:
+            # st.download_button reads the whole file into Streamlit's media store: memory grows with the
+            # export size here. Set HLR_EXPORT_URL to stream it instead.
+            with open(export_path, 'rb') as f:
+                st.download_button(
+                    label=f"Download {export_format.upper()}",
+                    data=f,
+                    file_name=os.path.basename(export_path),
+                    mime=MIME_TYPES[export_format]
+                )
 
 with col2:
     filter_info = f"Operation: {operation_filter}"
     if file_filter != "All":
         filter_info += f" | File: {file_filter}"
-    if 'date' in df.columns:
-        st.info(f"📊 Showing {len(df):,} records from {df['date'].min()} to {df['date'].max()} | {filter_info}")
+    if not daily_ops.empty:
+        st.info(f"📊 Showing {total_records:,} records from {daily_ops['date'].min()} to {daily_ops['date'].max()} | {filter_info}")
     else:
-        st.info(f"📊 Showing {len(df):,} records | {filter_info}")
\ No newline at end of file
+        st.info(f"📊 Showing {total_records:,} records | {filter_info}")
+
+metrics.observe('rerun', time.perf_counter() - rerun_started)
+
+# Hidden performance panel: open the dashboard with ?perf=1
+if st.experimental_get_query_params().get('perf') == ['1']:
+    with st.expander("⏱️ Performance", expanded=True):
+        perf = metrics.snapshot()
+        st.caption("Per-stage timings and counters for this dashboard process, since it started")
+        timings = pd.DataFrame([
+            {'stage': timer['stage'], 'labels': ', '.join(f"{k}={v}" for k, v in timer['labels'].items()),
+             'runs': timer['count'], 'total_s': round(timer['total_s'], 3), 'mean_ms': round(timer['mean_ms'], 1),
+             'max_ms': round(timer['max_ms'], 1)}
+            for timer in perf['timers']
+        ])
+        if not timings.empty:
+            st.dataframe(timings.sort_values('total_s', ascending=False), use_container_width=True, hide_index=True)
+        counters = pd.DataFrame([
+            {'counter': counter['name'], 'labels': ', '.join(f"{k}={v}" for k, v in counter['labels'].items()),
+             'value': counter['value']}
+            for counter in perf['counters']
+        ])
+        if not counters.empty:
+            st.dataframe(counters, use_container_width=True, hide_index=True)
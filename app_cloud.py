@@ -1,10 +1,16 @@
 import streamlit as st
-import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 import json
 import os
-from datetime import datetime, timedelta
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from aggregate_service import AGGREGATE_URL, AggregateClient, AggregateService, FrameSource
+from export import MIME_TYPES, iter_table_chunks, write_export
+from hlr_frame import count_frame, frame_from_table, hlr_status, table_order, to_compact_frame
+from snapshot import load_counts, load_table, manifest_signature
 
 # Page config
 st.set_page_config(
@@ -42,21 +48,65 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-# Load data from JSON file or use sample data
-try:
+def data_source():
+    # The snapshot manifest (or the legacy JSON file) identifies the data; the cache reloads only when it changes
+    signature = manifest_signature()
+    if signature:
+        return 'snapshot', signature
     if os.path.exists('hlr_data.json'):
-        with open('hlr_data.json', 'r') as f:
-            data = json.load(f)
-    else:
-        # Fallback sample data
-        data = [
-            {"operation": "SIMREG", "bss_msisdn": "60105211003", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "hlrout_2025-07-13_10-45.txt"},
-            {"operation": "CHANGEMSISDN", "bss_msisdn": "60192335883", "hlr_msisdn": "60105055478", "file_name": "hlrout_2025-07-13_08-45.txt"},
-            {"operation": "SIMREG", "bss_msisdn": "60108010732", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "hlrout_2025-07-13_12-00.txt"},
-            {"operation": "CHANGEMSISDN", "bss_msisdn": "60176364408", "hlr_msisdn": "601135250267", "file_name": "hlrout_2025-07-13_08-45.txt"}
-        ]
-except:
-    data = [{"operation": "SIMREG", "bss_msisdn": "60105211003", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "sample.txt"}]
+        stat = os.stat('hlr_data.json')
+        return 'json', (stat.st_mtime_ns, stat.st_size)
+    return 'sample', None
+
+@st.cache_resource(show_spinner="Loading data...", max_entries=1)
+def load_data(source, signature):
+    # Shared by every session and rerun: the rows as an Arrow table (memory-mapped for the snapshot), their
+    # per-file, per-operation counts that the metrics and charts are built from, and the display order
+    try:
+        if source == 'snapshot':
+            table = load_table()
+            return table, load_counts(), display_order(table)
+        elif source == 'json':
+            with open('hlr_data.json', 'r') as f:
+                data = json.load(f)
+        else:
+            # Fallback sample data
+            data = [
+                {"operation": "SIMREG", "bss_msisdn": "60105211003", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "hlrout_2025-07-13_10-45.txt"},
+                {"operation": "CHANGEMSISDN", "bss_msisdn": "60192335883", "hlr_msisdn": "60105055478", "file_name": "hlrout_2025-07-13_08-45.txt"},
+                {"operation": "SIMREG", "bss_msisdn": "60108010732", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "hlrout_2025-07-13_12-00.txt"},
+                {"operation": "CHANGEMSISDN", "bss_msisdn": "60176364408", "hlr_msisdn": "601135250267", "file_name": "hlrout_2025-07-13_08-45.txt"}
+            ]
+    except:
+        data = [{"operation": "SIMREG", "bss_msisdn": "60105211003", "hlr_msisdn": "HLR MSISDN NO DATA FOUND", "file_name": "sample.txt"}]
+
+    frame = to_compact_frame(data)
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    return table, count_frame(frame), display_order(table)
+
+def display_order(table):
+    # Latest files first, sorted once so every filtered view is already in display order
+    if 'file_name' in table.column_names:
+        return table_order(table, 'file_name', descending=True)
+    return pa.array(range(table.num_rows), pa.uint64())
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def unique_msisdn(_table, _rows, source, signature, operation_filter, file_filter):
+    # The only per-row aggregate left; cached per data version and filter instead of rescanned on each rerun
+    return pc.count_distinct(_table['bss_msisdn'].take(_rows)).as_py()
+
+@st.cache_resource
+def aggregate_client():
+    # Metrics and charts come from the aggregate service: the shared one if configured, otherwise one
+    # embedded here over the same cached counts, recomputed only when data_source() changes
+    if AGGREGATE_URL:
+        return AggregateClient(AGGREGATE_URL)
+    return AggregateClient(service=AggregateService(
+        FrameSource(signature=data_source, load_counts=lambda: load_data(*data_source())[1])
+    ))
+
+source, signature = data_source()
+all_data, all_counts, all_rows = load_data(source, signature)
 
 # Header
 st.markdown('<h1 class="main-header">📊 HLR Analytics Dashboard</h1>', unsafe_allow_html=True)
@@ -74,8 +124,7 @@ with st.sidebar:
     
     # File filter
     st.subheader("📁 File Filter")
-    all_data = pd.DataFrame(data)
-    unique_files = sorted(all_data['file_name'].unique(), reverse=True) if 'file_name' in all_data.columns else []
+    unique_files = sorted(all_counts['file_name'].unique(), reverse=True) if 'file_name' in all_counts.columns else []
     file_filter = st.selectbox(
         "Select File",
         ["All"] + unique_files
@@ -87,45 +136,53 @@ with st.sidebar:
     
     st.info("💡 This is a demo version with sample data. Local version has full functionality.")
 
-# Filter data
-df = pd.DataFrame(data)
+# Filter data; metrics and charts come from the aggregate service, the rows only feed the table and export.
+# rows are indices into all_data in display order; only the page and export chunks become pandas frames
+rows = all_rows
 if operation_filter != "All":
-    df = df[df['operation'] == operation_filter]
-if file_filter != "All" and 'file_name' in df.columns:
-    df = df[df['file_name'] == file_filter]
+    rows = pc.filter(rows, pc.equal(all_data['operation'], operation_filter).take(rows).combine_chunks())
+if file_filter != "All" and 'file_name' in all_data.column_names:
+    rows = pc.filter(rows, pc.equal(all_data['file_name'], file_filter).take(rows).combine_chunks())
 
-if df.empty:
+if len(rows) == 0:
     st.warning("⚠️ No data found for selected criteria")
     st.stop()
 
+summary = aggregate_client().summary(operation_filter=operation_filter, file_filter=file_filter)
+
 # Check for recent data updates
-if 'file_name' in df.columns:
+if 'file_name' in all_data.column_names:
     # Check if data was recently synced (files from today)
-    today_files = df[df['file_name'].str.contains('2025-07-13', na=False)]
+    today_files = summary['files'][summary['files']['file_name'].str.contains('2025-07-13', na=False)]
     if len(today_files) > 0:
         unique_files = today_files['file_name'].unique()
-        st.success(f"🆕 {len(today_files)} records from {len(unique_files)} files synced from server!")
+        st.success(f"🆕 {today_files['count'].sum()} records from {len(unique_files)} files synced from server!")
         with st.expander("View synced files"):
             for file in unique_files:
                 st.write(f"📄 {file}")
 
+status_counts = summary['status']
+total_records = summary['metrics']['total']
+found_records = summary['metrics']['found']
+operation_totals = status_counts.groupby('operation', observed=True)['count'].sum()
+
 # Key Metrics
 st.subheader("📈 Key Metrics")
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric("📊 Total Records", f"{len(df):,}")
+    st.metric("📊 Total Records", f"{total_records:,}")
 
 with col2:
-    simreg_count = len(df[df['operation'] == 'SIMREG'])
+    simreg_count = summary['metrics']['operations'].get('SIMREG', 0)
     st.metric("📱 SIMREG", f"{simreg_count:,}")
 
 with col3:
-    change_count = len(df[df['operation'] == 'CHANGEMSISDN'])
+    change_count = summary['metrics']['operations'].get('CHANGEMSISDN', 0)
     st.metric("🔄 CHANGEMSISDN", f"{change_count:,}")
 
 with col4:
-    success_rate = len(df[~df['hlr_msisdn'].str.contains('NO DATA FOUND', na=False)]) / len(df) * 100 if len(df) > 0 else 0
+    success_rate = summary['metrics']['success_rate']
     st.metric("✅ Success Rate", f"{success_rate:.1f}%")
 
 # Charts Section
@@ -138,8 +195,9 @@ with tab1:
     
     with col1:
         # Operation distribution
+        operation_counts = operation_totals.rename_axis('operation').reset_index(name='count')
         fig_pie = px.pie(
-            df, names='operation',
+            operation_counts[operation_counts['count'] > 0], names='operation', values='count',
             title="⚙️ Operation Distribution",
             color_discrete_sequence=['#667eea', '#764ba2']
         )
@@ -147,11 +205,9 @@ with tab1:
     
     with col2:
         # HLR data availability
-        df['hlr_status'] = df['hlr_msisdn'].apply(
-            lambda x: 'Data Found' if 'NO DATA FOUND' not in str(x) else 'No Data Found'
-        )
+        status_data = status_counts.groupby(['operation', hlr_status(status_counts['hlr_found'])], observed=True)['count'].sum()
         fig_status = px.bar(
-            df.groupby(['operation', 'hlr_status']).size().reset_index(name='count'),
+            status_data.rename_axis(['operation', 'hlr_status']).reset_index(name='count'),
             x='operation', y='count', color='hlr_status',
             title="📊 HLR Data Availability by Operation",
             color_discrete_sequence=['#28a745', '#dc3545']
@@ -164,11 +220,11 @@ with tab2:
     with col1:
         # Data quality metrics
         quality_metrics = {
-            'Total Records': len(df),
-            'Records with HLR Data': len(df[df['hlr_status'] == 'Data Found']),
-            'Records without HLR Data': len(df[df['hlr_status'] == 'No Data Found']),
-            'Unique MSISDN': df['bss_msisdn'].nunique(),
-            'Unique Operations': df['operation'].nunique()
+            'Total Records': total_records,
+            'Records with HLR Data': found_records,
+            'Records without HLR Data': total_records - found_records,
+            'Unique MSISDN': unique_msisdn(all_data, rows, source, signature, operation_filter, file_filter),
+            'Unique Operations': len(operation_totals)
         }
         
         st.markdown("### 📋 Data Quality Summary")
@@ -177,9 +233,8 @@ with tab2:
     
     with col2:
         # Success rate by operation
-        success_by_op = df.groupby('operation').apply(
-            lambda x: len(x[x['hlr_status'] == 'Data Found']) / len(x) * 100
-        ).reset_index(name='success_rate')
+        found_by_op = status_counts[status_counts['hlr_found']].groupby('operation', observed=True)['count'].sum()
+        success_by_op = (found_by_op.reindex(operation_totals.index, fill_value=0) / operation_totals * 100).rename_axis('operation').reset_index(name='success_rate')
         
         fig_success = px.bar(
             success_by_op, x='operation', y='success_rate',
@@ -190,11 +245,10 @@ with tab2:
         st.plotly_chart(fig_success, use_container_width=True)
 
 with tab3:
-    if 'file_name' in df.columns:
+    if 'file_name' in all_data.column_names:
         # File distribution
-        file_data = df.groupby('file_name').size().reset_index(name='count').sort_values('count', ascending=False)
         fig_files = px.bar(
-            file_data.head(10), x='count', y='file_name',
+            summary['files'].head(10), x='count', y='file_name',
             title="📁 Top 10 Files by Record Count",
             orientation='h',
             color_discrete_sequence=['#667eea']
@@ -205,37 +259,54 @@ with tab3:
 
 # Recent Records
 st.subheader("🕒 Recent Records")
-# Sort all data by file_name descending (latest files first)
-if 'file_name' in df.columns:
+# Latest files first; load_data already put the rows in file_name descending order
+if 'file_name' in all_data.column_names:
     columns_to_show = ['operation', 'bss_msisdn']
-    if 'bss_imsi' in df.columns:
+    if 'bss_imsi' in all_data.column_names:
         columns_to_show.append('bss_imsi')
     columns_to_show.append('hlr_msisdn')
-    if 'hlr_imsi' in df.columns:
+    if 'hlr_imsi' in all_data.column_names:
         columns_to_show.append('hlr_imsi')
     columns_to_show.append('file_name')
-    
-    recent_df = df.sort_values('file_name', ascending=False).head(50)[columns_to_show]
+    columns_to_show.append('hlr_found')
 else:
-    recent_df = df.head(50)
+    columns_to_show = list(all_data.column_names)
+
+# Only the visible page (and only the columns shown) is converted and handed to the table widget
+page_size = 50
+page_count = max(1, -(-len(rows) // page_size))
+page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+recent_df = frame_from_table(all_data.select(columns_to_show).take(rows[(page - 1) * page_size:page * page_size]))
 st.dataframe(recent_df, use_container_width=True)
+st.caption(f"Page {page} of {page_count}")
 
 # Export functionality
 st.subheader("💾 Export Data")
 col1, col2 = st.columns(2)
 
 with col1:
-    if st.button("📥 Download Data (CSV)"):
-        csv = df.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name=f"hlr_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            mime="text/csv"
+    export_format = st.radio("Format", ["CSV", "Parquet"], horizontal=True).lower()
+    if st.button("📥 Export Data"):
+        progress_bar = st.progress(0.0, text="Exporting...")
+        export_path, exported = write_export(
+            iter_table_chunks(all_data, rows), all_data.column_names, export_format, total_rows=len(rows),
+            schema=all_data.schema,
+            progress=lambda done, total: progress_bar.progress(
+                min(done / total, 1.0), text=f"Exported {done:,} of {total:,} rows"
+            )
         )
+        progress_bar.progress(1.0, text=f"Exported {exported:,} rows")
+        # Streamlit reads the whole file into its media store; the hosted demo has no port to stream it from
+        with open(export_path, 'rb') as f:
+            st.download_button(
+                label=f"Download {export_format.upper()}",
+                data=f,
+                file_name=os.path.basename(export_path),
+                mime=MIME_TYPES[export_format]
+            )
 
 with col2:
     filter_info = f"Operation: {operation_filter}"
     if file_filter != "All":
         filter_info += f" | File: {file_filter}"
-    st.info(f"📊 Showing {len(df):,} records | {filter_info}")
\ No newline at end of file
+    st.info(f"📊 Showing {len(rows):,} records | {filter_info}")
\ No newline at end of file
@@ -0,0 +1,55 @@
+import argparse
+import json
+import sys
+
+THRESHOLD = 0.1
+# Higher is better for these leaves; every other number is a duration or size where lower is better
+HIGHER_IS_BETTER = ('rows_per_s', 'mb_per_s')
+COMPARED = HIGHER_IS_BETTER + ('median_ms', 'seconds')
+
+def flatten(results, prefix=''):
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from flatten(value, f"{name}.")
+        elif isinstance(value, (int, float)) and key in COMPARED:
+            yield name, value
+
+def compare(baseline, candidate, threshold=THRESHOLD):
+    """(metric, baseline, candidate, relative change, regressed) for every metric both runs measured."""
+    old = dict(flatten(baseline['results']))
+    rows = []
+    for name, new in flatten(candidate['results']):
+        if name not in old or not old[name]:
+            continue
+        change = (new - old[name]) / old[name]
+        worse = -change if name.endswith(HIGHER_IS_BETTER) else change
+        rows.append((name, old[name], new, change, worse > threshold))
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument('baseline')
+    parser.add_argument('candidate')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="relative slowdown reported as a regression (default: %(default)s)")
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    if baseline['params'] != candidate['params']:
+        print(f"Warning: runs used different parameters\n  {baseline['params']}\n  {candidate['params']}")
+
+    rows = compare(baseline, candidate, args.threshold)
+    width = max((len(name) for name, *_ in rows), default=10)
+    print(f"{'metric':<{width}}  {baseline['commit'] or '?':>12}  {candidate['commit'] or '?':>12}  change")
+    for name, old, new, change, regressed in rows:
+        print(f"{name:<{width}}  {old:>12,}  {new:>12,}  {change:+.1%}{'  REGRESSION' if regressed else ''}")
+    regressions = sum(regressed for *_, regressed in rows)
+    print(f"{regressions} regressions beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
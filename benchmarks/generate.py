@@ -0,0 +1,82 @@
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+from hlr_decoder import NOT_FOUND_MARKER
+
+FILES = 8
+LINES_PER_FILE = 25000
+CHANGE_RATIO = 0.3
+NOT_FOUND_RATIO = 0.4
+MISMATCH_RATIO = 0.01
+INTERVAL_MINUTES = 15
+START = datetime(2025, 7, 13)
+SEED = 13
+
+LINE = ('{{"operation":"{0}","BSS":[{{"msisdn_no":"{1}","imsi_no":"{2}"}}],'
+        '"HLR":[{{"msisdn_no":"{3}","imsi_no":"{4}"}}]}}\n')
+HLR_MSISDN_NOT_FOUND = f"HLR MSISDN {NOT_FOUND_MARKER}"
+HLR_IMSI_NOT_FOUND = f"HLR IMSI {NOT_FOUND_MARKER}"
+
+def random_msisdn(rng):
+    # Malaysian mobile numbers as the verify job sees them: 601 plus eight or nine digits
+    return f"601{rng.randrange(10 ** 8, 10 ** 9 if rng.random() < 0.7 else 10 ** 10)}"
+
+def random_imsi(rng):
+    return f"50219{rng.randrange(10 ** 10):010d}"
+
+def generate_lines(count, rng, change_ratio=CHANGE_RATIO, not_found_ratio=NOT_FOUND_RATIO,
+                   mismatch_ratio=MISMATCH_RATIO, subscribers=None):
+    """hlrout lines in the verify job's own format; subscribers (a list of (msisdn, imsi)) makes numbers repeat."""
+    for _ in range(count):
+        operation = 'CHANGEMSISDN' if rng.random() < change_ratio else 'SIMREG'
+        bss_msisdn, bss_imsi = rng.choice(subscribers) if subscribers else (random_msisdn(rng), random_imsi(rng))
+        if rng.random() < not_found_ratio:
+            hlr_msisdn, hlr_imsi = HLR_MSISDN_NOT_FOUND, HLR_IMSI_NOT_FOUND
+        else:
+            hlr_msisdn = random_msisdn(rng) if operation == 'CHANGEMSISDN' else bss_msisdn
+            hlr_imsi = random_imsi(rng) if rng.random() < mismatch_ratio else bss_imsi
+        yield LINE.format(operation, bss_msisdn, bss_imsi, hlr_msisdn, hlr_imsi)
+
+def generate_files(out_dir, files=FILES, lines_per_file=LINES_PER_FILE, change_ratio=CHANGE_RATIO,
+                   not_found_ratio=NOT_FOUND_RATIO, mismatch_ratio=MISMATCH_RATIO, subscribers=None, seed=SEED,
+                   start=START, interval_minutes=INTERVAL_MINUTES):
+    """Write hlrout_YYYY-MM-DD_HH-MM.txt files interval_minutes apart; the same seed gives the same bytes."""
+    rng = random.Random(seed)
+    pool = [(random_msisdn(rng), random_imsi(rng)) for _ in range(subscribers)] if subscribers else None
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for index in range(files):
+        stamp = start + timedelta(minutes=interval_minutes * index)
+        path = os.path.join(out_dir, f"hlrout_{stamp:%Y-%m-%d_%H-%M}.txt")
+        with open(path, 'w', newline='\n') as f:
+            f.writelines(generate_lines(lines_per_file, rng, change_ratio, not_found_ratio, mismatch_ratio, pool))
+        paths.append(path)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Write synthetic hlrout files for benchmarks and load tests")
+    parser.add_argument('out_dir', help="directory to write the files to")
+    parser.add_argument('--files', type=int, default=FILES, help="number of files (default: %(default)s)")
+    parser.add_argument('--lines', type=int, default=LINES_PER_FILE, help="lines per file (default: %(default)s)")
+    parser.add_argument('--change-ratio', type=float, default=CHANGE_RATIO,
+                        help="share of CHANGEMSISDN lines, the rest are SIMREG (default: %(default)s)")
+    parser.add_argument('--not-found-ratio', type=float, default=NOT_FOUND_RATIO,
+                        help="share of lines with NO DATA FOUND on the HLR side (default: %(default)s)")
+    parser.add_argument('--mismatch-ratio', type=float, default=MISMATCH_RATIO,
+                        help="share of found lines whose HLR IMSI differs (default: %(default)s)")
+    parser.add_argument('--subscribers', type=int,
+                        help="draw numbers from this many subscribers instead of making every line unique")
+    parser.add_argument('--seed', type=int, default=SEED, help="random seed (default: %(default)s)")
+    parser.add_argument('--start', type=datetime.fromisoformat, default=START,
+                        help="timestamp of the first file name (default: %(default)s)")
+    args = parser.parse_args()
+
+    paths = generate_files(args.out_dir, args.files, args.lines, args.change_ratio, args.not_found_ratio,
+                           args.mismatch_ratio, args.subscribers, args.seed, args.start)
+    size = sum(os.path.getsize(path) for path in paths)
+    print(f"Wrote {len(paths)} files, {args.files * args.lines:,} lines ({size / 1e6:,.1f} MB) to {args.out_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,273 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime
+
+import db
+from benchmarks.generate import CHANGE_RATIO, FILES, LINES_PER_FILE, NOT_FOUND_RATIO, SEED, generate_files
+from data_access import filter_clause, get_data, get_records_page, get_summary, get_unique_counts
+from hlr_decoder import iter_batches
+from hlr_frame import count_frame, to_compact_frame
+from hlr_parser import BATCH_SIZE, INSERT_COLUMNS, LOAD_MODES, delete_file_rows, insert_file
+
+RESULTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+REPEATS = 5
+# Rows the MySQL benchmarks insert are tagged with this source and deleted again afterwards
+BENCH_SOURCE = 'benchmark'
+
+# Same shape as hlr_verification and hlr_hourly_rollup, minus the MySQL-only parts (partitions, ON DUPLICATE KEY)
+SQLITE_SCHEMA = """
+    CREATE TABLE hlr_verification (
+        id INTEGER PRIMARY KEY, operation TEXT, bss_msisdn TEXT, bss_imsi TEXT, hlr_msisdn TEXT, hlr_imsi TEXT,
+        recon_status INTEGER, source TEXT, file_name TEXT, record_timestamp TEXT
+    );
+    CREATE INDEX idx_timestamp_operation ON hlr_verification (record_timestamp, operation);
+    CREATE INDEX idx_file_name ON hlr_verification (file_name);
+    CREATE TABLE hlr_hourly_rollup (
+        hour_start TEXT, operation TEXT, source TEXT, file_name TEXT, hlr_found INTEGER, recon_status INTEGER,
+        record_count INTEGER, PRIMARY KEY (hour_start, operation, source, file_name, hlr_found, recon_status)
+    );
+"""
+# The dashboard queries that run unchanged on SQLite: get_data's scan and get_summary's rollup GROUP BYs
+SQLITE_QUERIES = {
+    'get_data': ('record_timestamp', "SELECT * FROM hlr_verification WHERE {where} ORDER BY record_timestamp DESC"),
+    'summary_daily': ('hour_start', """
+        SELECT DATE(hour_start) AS date, operation, SUM(record_count) FROM hlr_hourly_rollup WHERE {where}
+        GROUP BY DATE(hour_start), operation ORDER BY date
+    """),
+    'summary_status': ('hour_start', """
+        SELECT operation, hlr_found, SUM(record_count) FROM hlr_hourly_rollup WHERE {where}
+        GROUP BY operation, hlr_found
+    """),
+    'summary_files': ('hour_start', """
+        SELECT file_name, SUM(record_count) AS count FROM hlr_hourly_rollup WHERE {where}
+        GROUP BY file_name ORDER BY count DESC LIMIT 10
+    """),
+}
+
+def timed(fn, repeats=REPEATS):
+    samples = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {'min_ms': round(min(samples) * 1000, 3), 'median_ms': round(statistics.median(samples) * 1000, 3),
+            'max_ms': round(max(samples) * 1000, 3)}
+
+def throughput(rows, size, seconds):
+    return {'rows': rows, 'seconds': round(seconds, 4), 'rows_per_s': round(rows / seconds),
+            'mb_per_s': round(size / 1e6 / seconds, 2)}
+
+def filters(paths):
+    # (label, operation filter, file filter) combinations the dashboards offer
+    return [('all', None, None), ('SIMREG', 'SIMREG', None), ('CHANGEMSISDN', 'CHANGEMSISDN', None),
+            ('one_file', None, os.path.basename(paths[-1]))]
+
+def bench_parse(paths, batch_size=BATCH_SIZE, repeats=REPEATS):
+    # Decode and reconcile every line, as the loaders do before anything reaches the database
+    def parse():
+        rows = 0
+        for path in paths:
+            with open(path, 'rb') as f:
+                for batch in iter_batches(f, batch_size):
+                    batch.reconcile()
+                    rows += len(batch)
+        return rows
+
+    rows = parse()
+    size = sum(os.path.getsize(path) for path in paths)
+    timing = timed(parse, repeats)
+    return {**throughput(rows, size, timing['median_ms'] / 1000), **timing}
+
+def read_records(paths, batch_size=BATCH_SIZE):
+    records = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            for batch in iter_batches(f, batch_size):
+                columns = batch.columns()
+                del columns['hlr_found']
+                columns['file_name'] = [os.path.basename(path)] * len(batch)
+                records.extend(dict(zip(columns, values)) for values in zip(*columns.values()))
+    return records
+
+def dashboard_metrics(df, counts, operation=None, file_name=None):
+    # app_cloud's per-rerun work: filter the rows and counts, then the metrics and chart inputs from the counts
+    if operation:
+        df = df[df['operation'] == operation]
+        counts = counts[counts['operation'] == operation]
+    if file_name:
+        df = df[df['file_name'] == file_name]
+        counts = counts[counts['file_name'] == file_name]
+    total = int(counts['count'].sum())
+    found = int(counts.loc[counts['hlr_found'], 'count'].sum())
+    by_operation = counts.groupby('operation', observed=True)['count'].sum()
+    by_file = counts.groupby('file_name', observed=True)['count'].sum().nlargest(10)
+    return total, found, by_operation, by_file, df['bss_msisdn'].nunique()
+
+def bench_aggregate(paths, repeats=REPEATS):
+    records = read_records(paths)
+    results = {'rows': len(records)}
+    results['build'] = timed(lambda: count_frame(to_compact_frame(records)), repeats)
+    df = to_compact_frame(records)
+    counts = count_frame(df)
+    for label, operation, file_name in filters(paths):
+        results[f"metrics[{label}]"] = timed(lambda: dashboard_metrics(df, counts, operation, file_name), repeats)
+    return results
+
+def bench_insert_mysql(paths, load_mode='multirow', batch_size=BATCH_SIZE):
+    # Whole-file transactions through hlr_parser's own insert path (rows, rollup and failure tally)
+    conn = db.get_connection(allow_local_infile=(load_mode == 'load-data'))
+    cursor = conn.cursor()
+    rows = 0
+    started = time.perf_counter()
+    try:
+        for path in paths:
+            with open(path, 'rb') as f:
+                rows += insert_file(conn, cursor, os.path.basename(path), f, batch_size, load_mode,
+                                    source=BENCH_SOURCE)[0]
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return {**throughput(rows, sum(os.path.getsize(path) for path in paths), time.perf_counter() - started),
+            'load_mode': load_mode}
+
+def cleanup_mysql(paths):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        for path in paths:
+            delete_file_rows(cursor, os.path.basename(path), BENCH_SOURCE)
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+def bench_queries_mysql(paths, repeats=REPEATS):
+    # The dashboard's data_access calls with their result cache bypassed, so every repeat hits MySQL
+    results = {}
+    for fn in (get_data, get_summary, get_records_page, get_unique_counts):
+        query = getattr(fn, '__wrapped__', fn)
+        for label, operation, file_name in filters(paths):
+            results[f"{fn.__name__}[{label}]"] = timed(
+                lambda: query(operation_filter=operation, file_filter=file_name), repeats
+            )
+    return results
+
+def bench_insert_sqlite(conn, paths, batch_size=BATCH_SIZE):
+    rows = 0
+    placeholders = ', '.join(['?'] * len(INSERT_COLUMNS.split(',')))
+    started = time.perf_counter()
+    for path in paths:
+        file_name = os.path.basename(path)
+        with open(path, 'rb') as f:
+            for batch in iter_batches(f, batch_size):
+                ingested_at = datetime.now().replace(microsecond=0)
+                hour_start = ingested_at.replace(minute=0, second=0)
+                conn.executemany(f"INSERT INTO hlr_verification ({INSERT_COLUMNS}) VALUES ({placeholders})",
+                                 batch.rows(BENCH_SOURCE, file_name, str(ingested_at)))
+                counts = Counter(zip(batch.operation, batch.hlr_found, batch.recon_status))
+                conn.executemany("""
+                    INSERT INTO hlr_hourly_rollup VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT DO UPDATE SET record_count = record_count + excluded.record_count
+                """, [(str(hour_start), operation, BENCH_SOURCE, file_name, hlr_found, recon_status, count)
+                      for (operation, hlr_found, recon_status), count in counts.items()])
+                rows += len(batch)
+        conn.commit()
+    return throughput(rows, sum(os.path.getsize(path) for path in paths), time.perf_counter() - started)
+
+def bench_queries_sqlite(conn, paths, repeats=REPEATS):
+    results = {}
+    for name, (time_column, query) in SQLITE_QUERIES.items():
+        for label, operation, file_name in filters(paths):
+            where, params = filter_clause(time_column, operation_filter=operation, file_filter=file_name)
+            sql = query.format(where=where.replace('%s', '?'))
+            results[f"{name}[{label}]"] = timed(lambda: conn.execute(sql, params).fetchall(), repeats)
+    return results
+
+def git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True)
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True, text=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit.stdout.strip(), bool(dirty.stdout.strip())
+
+def run(benchmarks, data_dir, database='sqlite', load_mode='multirow', repeats=REPEATS):
+    paths = sorted(os.path.join(data_dir, name) for name in os.listdir(data_dir) if name.startswith('hlrout_'))
+    results = {}
+    if 'parse' in benchmarks:
+        results['parse'] = bench_parse(paths, repeats=repeats)
+        print(f"parse: {results['parse']['rows_per_s']:,} rows/s")
+    if 'aggregate' in benchmarks:
+        results['aggregate'] = bench_aggregate(paths, repeats)
+        print(f"aggregate: build {results['aggregate']['build']['median_ms']:,} ms")
+    if 'insert' in benchmarks or 'query' in benchmarks:
+        if database == 'mysql':
+            try:
+                results['insert'] = bench_insert_mysql(paths, load_mode)
+                if 'query' in benchmarks:
+                    results['query'] = bench_queries_mysql(paths, repeats)
+            finally:
+                cleanup_mysql(paths)
+        else:
+            conn = sqlite3.connect(':memory:')
+            conn.executescript(SQLITE_SCHEMA)
+            results['insert'] = bench_insert_sqlite(conn, paths)
+            if 'query' in benchmarks:
+                results['query'] = bench_queries_sqlite(conn, paths, repeats)
+            conn.close()
+        print(f"insert ({database}): {results['insert']['rows_per_s']:,} rows/s")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing, loading, dashboard queries and aggregation")
+    parser.add_argument('benchmarks', nargs='*', default=['parse', 'aggregate', 'insert', 'query'],
+                        help="any of parse, aggregate, insert, query (default: all)")
+    parser.add_argument('--data', help="existing directory of hlrout files instead of generating them")
+    parser.add_argument('--files', type=int, default=FILES, help="generated files (default: %(default)s)")
+    parser.add_argument('--lines', type=int, default=LINES_PER_FILE,
+                        help="lines per generated file (default: %(default)s)")
+    parser.add_argument('--change-ratio', type=float, default=CHANGE_RATIO)
+    parser.add_argument('--not-found-ratio', type=float, default=NOT_FOUND_RATIO)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--db', choices=('sqlite', 'mysql'), default='sqlite',
+                        help="in-memory SQLite stand-in, or the MySQL in db.py (default: %(default)s)")
+    parser.add_argument('--db-host', help="override db.py's MySQL host, e.g. 127.0.0.1 for the compose container")
+    parser.add_argument('--load-mode', choices=LOAD_MODES, default='multirow')
+    parser.add_argument('--repeats', type=int, default=REPEATS, help="timed repeats per case (default: %(default)s)")
+    parser.add_argument('--out', help="results file (default: benchmarks/results/<time>-<commit>.json)")
+    args = parser.parse_args()
+
+    if args.db_host:
+        db.DB_CONFIG['host'] = args.db_host
+    commit, dirty = git_commit()
+    params = {'files': args.files, 'lines': args.lines, 'change_ratio': args.change_ratio,
+              'not_found_ratio': args.not_found_ratio, 'seed': args.seed, 'db': args.db,
+              'load_mode': args.load_mode, 'repeats': args.repeats, 'data': args.data}
+    with tempfile.TemporaryDirectory(prefix='hlr_bench_') as tmp:
+        data_dir = args.data
+        if data_dir is None:
+            data_dir = tmp
+            generate_files(data_dir, args.files, args.lines, args.change_ratio, args.not_found_ratio, seed=args.seed)
+        results = run(args.benchmarks, data_dir, args.db, args.load_mode, args.repeats)
+
+    report = {'commit': commit, 'dirty': dirty, 'created_at': datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(), 'platform': platform.platform(), 'params': params,
+              'results': results}
+    out = args.out or os.path.join(RESULTS_PATH, f"{datetime.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(report, f, indent=1)
+        f.write('\n')
+    print(f"Results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import wraps
+
+import pandas as pd
+from mysql.connector import pooling
+
+import metrics
+from db import DB_CONFIG, get_connection, get_version
+from export import CHUNK_SIZE
+from hlr_frame import to_compact_frame
+from hll import HyperLogLog
+from hlr_parser import SEARCH_COLUMNS, SKETCH_COLUMNS, search_subscriber
+
+# Shared by every Streamlit session in the process: one connection pool, and one result cache keyed
+# by query + filters that is invalidated when the ingest watermark moves rather than on a timer.
+POOL_SIZE = 8
+CACHE_SIZE = 256
+WATERMARK_TTL = 5
+
+_pool = None
+_pool_lock = threading.Lock()
+_pool_slots = threading.BoundedSemaphore(POOL_SIZE)
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_watermark = {'value': None, 'checked_at': 0.0}
+_watermark_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pooling.MySQLConnectionPool(pool_name='hlr_dashboard', pool_size=POOL_SIZE, **DB_CONFIG)
+    return _pool
+
+@contextmanager
+def pooled_connection():
+    # MySQLConnectionPool raises instead of waiting when it is exhausted, so queue on a semaphore first
+    with _pool_slots:
+        conn = get_pool().get_connection()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+def get_watermark():
+    # The ingest version (db.bump_version) moves on every ingest commit, sketch merge and partition drop or
+    # restore, even when a file with lower ids commits after one with higher ids and (MIN(id), MAX(id))
+    # stays put. The value is itself shared for a few seconds, so concurrent reruns cost at most one
+    # lookup per WATERMARK_TTL.
+    with _watermark_lock:
+        if time.monotonic() - _watermark['checked_at'] < WATERMARK_TTL:
+            return _watermark['value']
+        with metrics.timer('query', query='watermark'), pooled_connection() as conn:
+            cursor = conn.cursor()
+            _watermark['value'] = get_version(cursor)
+            cursor.close()
+        _watermark['checked_at'] = time.monotonic()
+        return _watermark['value']
+
+def _copy(result):
+    # Cached frames are shared between sessions, so hand each caller its own copy to mutate
+    if isinstance(result, pd.DataFrame):
+        return result.copy()
+    if isinstance(result, dict):
+        return {key: _copy(value) for key, value in result.items()}
+    return result
+
+def cached(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = (fn.__name__, args, tuple(sorted(kwargs.items())))
+        watermark = get_watermark()
+        with _cache_lock:
+            entry = _cache.get(key)
+            if entry and entry[0] == watermark:
+                _cache.move_to_end(key)
+                metrics.count('query_cache_hits', query=fn.__name__)
+                return _copy(entry[1])
+        with metrics.timer('query', query=fn.__name__):
+            result = fn(*args, **kwargs)
+        with _cache_lock:
+            _cache[key] = (watermark, result)
+            _cache.move_to_end(key)
+            while len(_cache) > CACHE_SIZE:
+                _cache.popitem(last=False)
+        return _copy(result)
+    return wrapper
+
+def expire_watermark():
+    # Forces the next cached call to re-check the watermark; results only recompute if it moved
+    with _watermark_lock:
+        _watermark['checked_at'] = 0.0
+
+RECORD_COLUMNS = ('record_timestamp', 'operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi', 'recon_status',
+                  'source', 'file_name')
+PAGE_SIZE = 20
+REPEAT_FAILURES = 2
+FAILURE_LIMIT = 100
+EXPORT_COLUMNS = ('id',) + RECORD_COLUMNS
+
+def date_range_bounds(start_date=None, end_date=None):
+    # Half-open [start 00:00, day after end 00:00) so record_timestamp is compared bare and stays index-friendly
+    start = datetime.combine(start_date, datetime.min.time()) if start_date else None
+    end = datetime.combine(end_date + timedelta(days=1), datetime.min.time()) if end_date else None
+    return start, end
+
+def filter_clause(time_column, start_date=None, end_date=None, operation_filter=None, file_filter=None):
+    query = "1=1"
+    params = []
+    
+    start, end = date_range_bounds(start_date, end_date)
+    if start:
+        query += f" AND {time_column} >= %s"
+        params.append(start)
+    if end:
+        query += f" AND {time_column} < %s"
+        params.append(end)
+    if operation_filter and operation_filter != 'All':
+        query += " AND operation = %s"
+        params.append(operation_filter)
+    if file_filter and file_filter != 'All':
+        query += " AND file_name = %s"
+        params.append(file_filter)
+    return query, params
+
+def get_data(start_date=None, end_date=None, operation_filter=None, file_filter=None):
+    # Full filtered table; deliberately not cached
+    where, params = filter_clause('record_timestamp', start_date, end_date, operation_filter, file_filter)
+    query = f"SELECT * FROM hlr_verification WHERE {where} ORDER BY record_timestamp DESC"
+    
+    with pooled_connection() as conn:
+        return pd.read_sql(query, conn, params=params)
+
+def iter_data_chunks(start_date=None, end_date=None, operation_filter=None, file_filter=None, chunk_size=CHUNK_SIZE):
+    # Unbuffered cursor on a dedicated connection: rows stream from the server chunk by chunk,
+    # and a long export never holds one of the dashboard's pooled connections
+    where, params = filter_clause('record_timestamp', start_date, end_date, operation_filter, file_filter)
+    conn = get_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT {', '.join(EXPORT_COLUMNS)} FROM hlr_verification WHERE {where}
+            ORDER BY record_timestamp DESC, id DESC
+        """, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+        cursor.close()
+    finally:
+        conn.close()
+
+@cached
+def get_summary(start_date=None, end_date=None, operation_filter=None, file_filter=None):
+    # Every chart and metric is a small GROUP BY over hlr_hourly_rollup, never over the raw rows
+    where, params = filter_clause('hour_start', start_date, end_date, operation_filter, file_filter)
+    queries = {
+        'daily': f"""
+            SELECT DATE(hour_start) AS date, operation, SUM(record_count) AS count
+            FROM hlr_hourly_rollup WHERE {where}
+            GROUP BY DATE(hour_start), operation ORDER BY date
+        """,
+        'hourly': f"""
+            SELECT HOUR(hour_start) AS hour, SUM(record_count) AS count
+            FROM hlr_hourly_rollup WHERE {where}
+            GROUP BY HOUR(hour_start) ORDER BY hour
+        """,
+        'status': f"""
+            SELECT operation, hlr_found, SUM(record_count) AS count
+            FROM hlr_hourly_rollup WHERE {where}
+            GROUP BY operation, hlr_found
+        """,
+        'files': f"""
+            SELECT file_name, SUM(record_count) AS count
+            FROM hlr_hourly_rollup WHERE {where}
+            GROUP BY file_name ORDER BY count DESC LIMIT 10
+        """,
+        'recon': f"""
+            SELECT operation, recon_status, SUM(record_count) AS count
+            FROM hlr_hourly_rollup WHERE {where}
+            GROUP BY operation, recon_status
+        """
+    }
+    with pooled_connection() as conn:
+        summary = {name: pd.read_sql(query, conn, params=params) for name, query in queries.items()}
+    
+    for name, frame in summary.items():
+        frame['count'] = frame['count'].astype('int64')
+        summary[name] = to_compact_frame(frame)
+    return summary
+
+@cached
+def get_unique_counts(start_date=None, end_date=None, operation_filter=None, file_filter=None, exact=False):
+    """Distinct BSS MSISDN, BSS IMSI and HLR MSISDN counts, with their relative standard error (0 if exact).
+
+    Estimates merge the hourly sketches in range; a file filter (which the sketches do not carry) or
+    exact=True runs COUNT(DISTINCT) over the rows instead.
+    """
+    if not exact and not (file_filter and file_filter != 'All'):
+        where, params = filter_clause('hour_start', start_date, end_date, operation_filter)
+        merged = {column: HyperLogLog() for column in SKETCH_COLUMNS}
+        with pooled_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT column_name, registers FROM hlr_hourly_sketch WHERE {where}", params)
+            for column, registers in cursor:
+                merged[column].merge(HyperLogLog.from_bytes(registers))
+            cursor.close()
+        return tuple(merged[column].estimate() for column in SKETCH_COLUMNS), HyperLogLog().relative_error
+
+    where, params = filter_clause('record_timestamp', start_date, end_date, operation_filter, file_filter)
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT
+                COUNT(DISTINCT bss_msisdn),
+                COUNT(DISTINCT bss_imsi),
+                COUNT(DISTINCT CASE WHEN hlr_msisdn <> '' AND hlr_msisdn NOT LIKE '%NO DATA FOUND%' THEN hlr_msisdn END)
+            FROM hlr_verification WHERE {where}
+        """, params)
+        counts = cursor.fetchone()
+        cursor.close()
+    return counts, 0.0
+
+@cached
+def get_records_page(start_date=None, end_date=None, operation_filter=None, file_filter=None,
+                     columns=RECORD_COLUMNS, after=None, page_size=PAGE_SIZE):
+    # Keyset pagination, newest first: `after` is the (record_timestamp, id) of the last row already shown,
+    # so each page is an index range read of page_size + 1 rows whatever the page number
+    columns = [column for column in RECORD_COLUMNS if column in columns]
+    where, params = filter_clause('record_timestamp', start_date, end_date, operation_filter, file_filter)
+    if after:
+        where += " AND (record_timestamp < %s OR (record_timestamp = %s AND id < %s))"
+        params += [after[0], after[0], after[1]]
+    selected = ['id'] + [column for column in columns if column != 'record_timestamp']
+    selected.append('record_timestamp AS cursor_timestamp')
+    query = f"""
+        SELECT {', '.join(selected)}
+        FROM hlr_verification WHERE {where}
+        ORDER BY record_timestamp DESC, id DESC LIMIT %s
+    """
+    
+    with pooled_connection() as conn:
+        page = pd.read_sql(query, conn, params=params + [page_size + 1])
+    
+    has_next = len(page) > page_size
+    page = page.head(page_size)
+    next_cursor = (page['cursor_timestamp'].iloc[-1].to_pydatetime(), int(page['id'].iloc[-1])) if has_next else None
+    if 'record_timestamp' in columns:
+        page.insert(0, 'record_timestamp', page['cursor_timestamp'])
+    return to_compact_frame(page[columns]), next_cursor
+
+@cached
+def get_subscriber_history(number, prefix=False):
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        rows = search_subscriber(number, prefix=prefix, cursor=cursor)
+        cursor.close()
+    return to_compact_frame(pd.DataFrame(rows, columns=list(SEARCH_COLUMNS)))
+
+@cached
+def get_repeat_failures(min_failures=REPEAT_FAILURES, limit=FAILURE_LIMIT):
+    query = """
+        SELECT bss_msisdn, recon_status, failure_count, last_file, last_seen
+        FROM hlr_subscriber_failures WHERE failure_count >= %s
+        ORDER BY failure_count DESC LIMIT %s
+    """
+    with pooled_connection() as conn:
+        failures = pd.read_sql(query, conn, params=[min_failures, limit])
+    return to_compact_frame(failures)
+
+@cached
+def get_file_names():
+    # Served from the rollup's file_name index rather than from a loaded frame
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT file_name FROM hlr_hourly_rollup ORDER BY file_name DESC")
+        file_names = [row[0] for row in cursor.fetchall() if row[0]]
+        cursor.close()
+    return file_names
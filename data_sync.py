@@ -1,33 +1,135 @@
-import json
-import mysql.connector
-import pandas as pd
+import argparse
+import os
 import subprocess
 from datetime import datetime
 
-def fetch_and_push_data():
-    # Get data from local MySQL instead of server
-    conn = mysql.connector.connect(
-        host='mysql',
-        user='hlruser',
-        password='hlrpass',
-        database='HLRDB'
-    )
-    
-    df = pd.read_sql("SELECT operation, bss_msisdn, hlr_msisdn, file_name FROM hlr_verification ORDER BY record_timestamp DESC LIMIT 100", conn)
+import metrics
+from db import get_connection, get_version
+from snapshot import (COMPACT_AFTER, MANIFEST_NAME, SNAPSHOT_COLUMNS, SNAPSHOT_PATH, append_rows, compact, drop_file,
+                      load_manifest, save_manifest)
+
+FETCH_SIZE = 10000
+SEED_ROWS = 10000
+
+def seed_watermark(cursor, seed_rows=SEED_ROWS):
+    # A new snapshot starts from the latest seed_rows records rather than the whole table
+    cursor.execute("SELECT MIN(id) FROM (SELECT id FROM hlr_verification ORDER BY id DESC LIMIT %s) latest",
+                   (seed_rows,))
+    first_id = cursor.fetchone()[0]
+    return first_id - 1 if first_id else 0
+
+def export_rows(cursor, manifest, query, params, root, fetch_size):
+    # Keyset on the primary key within the query's range; rows are appended in id order, a fetch at a time
+    changed, row_count, after = [], 0, 0
+    while True:
+        with metrics.timer('sync_query'):
+            cursor.execute(f"SELECT {', '.join(SNAPSHOT_COLUMNS)} FROM hlr_verification WHERE {query} AND id > %s "
+                           f"ORDER BY id LIMIT %s", params + (after, fetch_size))
+            rows = cursor.fetchall()
+        if not rows:
+            return changed, row_count
+        with metrics.timer('sync_write'):
+            changed += append_rows(manifest, rows, root)
+        row_count += len(rows)
+        after = rows[-1][0]
+
+def export_new_rows(root=SNAPSHOT_PATH, fetch_size=FETCH_SIZE, seed_rows=SEED_ROWS, compact_after=COMPACT_AFTER):
+    """Append rows committed since the manifest's version as new segments; returns (changed paths, removed paths, rows).
+
+    Loaders commit whole files out of id order, so rows are found through hlr_ingest_commits, which is in
+    commit order (db.bump_version), rather than past the highest id exported. A file reloaded since then
+    (a commit flagged replaced) has its earlier records dropped from the snapshot and is exported again whole.
+    """
+    os.makedirs(root, exist_ok=True)
+    manifest = load_manifest(root)
+    conn = get_connection()
+    cursor = conn.cursor()
+    # One consistent read: the version and the rows are seen as of the same moment
+    conn.start_transaction(consistent_snapshot=True, readonly=True)
+    version = get_version(cursor)
+
+    changed, removed, row_count = [], [], 0
+    if manifest.get('version') is None:
+        # A new snapshot starts from the latest seed_rows records, and one made before the commit log
+        # catches up by id once; from here on, later commits come from the log
+        watermark = manifest.pop('watermark', None)
+        if watermark is None:
+            watermark = seed_watermark(cursor, seed_rows)
+        changed, row_count = export_rows(cursor, manifest, "id > %s", (watermark,), root, fetch_size)
+    else:
+        cursor.execute("""
+            SELECT source, file_name, MIN(first_id), MAX(last_id), MAX(replaced) FROM hlr_ingest_commits
+            WHERE version > %s AND version <= %s GROUP BY source, file_name ORDER BY MIN(version)
+        """, (manifest['version'], version))
+        # A file's later commits always follow its earlier ones in id order too, so one range per file
+        for source, file_name, first_id, last_id, replaced in cursor.fetchall():
+            if replaced:
+                # Every row the file has now was written at or after the reload, so the whole file is this range
+                with metrics.timer('sync_drop'):
+                    dropped_added, dropped_removed = drop_file(manifest, source, file_name, root)
+                changed = [path for path in changed if path not in dropped_removed] + dropped_added
+                removed += dropped_removed
+                query, params = "source = %s AND file_name = %s", (source, file_name)
+            elif first_id is None:
+                continue
+            else:
+                query = "source = %s AND file_name = %s AND id BETWEEN %s AND %s"
+                params = (source, file_name, first_id, last_id)
+            file_changed, file_rows = export_rows(cursor, manifest, query, params, root, fetch_size)
+            changed += file_changed
+            row_count += file_rows
+    conn.rollback()
+    cursor.close()
     conn.close()
-    
-    all_data = df.to_dict('records')
-    
-
-    
-    # Save to JSON file
-    with open('hlr_data.json', 'w') as f:
-        json.dump(all_data, f)
-    
-    # Git push
-    subprocess.run(['git', 'add', 'hlr_data.json'])
-    subprocess.run(['git', 'commit', '-m', f'Update HLR data {datetime.now()}'])
-    subprocess.run(['git', 'push'])
+
+    # A version that added no rows (a sketch merge, a dropped partition) is only saved with the next change
+    manifest['version'] = version
+    with metrics.timer('sync_compact'):
+        added, compacted = compact(manifest, root, compact_after)
+    removed += compacted
+    changed = [path for path in changed if path not in removed] + [path for path in added if path not in changed]
+    if changed or removed or not os.path.exists(os.path.join(root, MANIFEST_NAME)):
+        changed.append(os.path.relpath(save_manifest(manifest, root), root))
+    return [os.path.join(root, path) for path in changed], [os.path.join(root, path) for path in removed], row_count
+
+def snapshot_pending(root=SNAPSHOT_PATH):
+    # Left behind by a sync whose commit or push failed after its manifest had already moved on
+    status = subprocess.run(['git', 'status', '--porcelain', '--', root], capture_output=True, text=True, check=True)
+    ahead = subprocess.run(['git', 'rev-list', '--count', '@{upstream}..HEAD'], capture_output=True, text=True)
+    return bool(status.stdout.strip()) or (ahead.returncode == 0 and int(ahead.stdout) > 0)
+
+def push_snapshot(root=SNAPSHOT_PATH):
+    # Everything under the snapshot that differs from HEAD is staged, not just this sync's files, so
+    # segments written by an earlier sync that failed to push go out with the manifest that lists them
+    subprocess.run(['git', 'add', '--all', '--', root], check=True)
+    if subprocess.run(['git', 'diff', '--cached', '--quiet', '--', root]).returncode:
+        subprocess.run(['git', 'commit', '-m', f'Update HLR data {datetime.now()}'], check=True)
+    subprocess.run(['git', 'push'], check=True)
+
+def fetch_and_push_data(push=True, root=SNAPSHOT_PATH, compact_after=COMPACT_AFTER):
+    with metrics.timer('sync_export', log=True) as fields:
+        changed, removed, row_count = export_new_rows(root, compact_after=compact_after)
+        fields.update(rows=row_count, changed=len(changed), removed=len(removed))
+    metrics.count('rows', row_count, stage='sync')
+    if not changed and not removed:
+        if not (push and snapshot_pending(root)):
+            print("Snapshot is up to date")
+            return 0
+        print("No new rows; pushing snapshot changes left by an earlier sync")
+    else:
+        print(f"Exported {row_count:,} new rows ({len(changed)} files written, {len(removed)} removed)")
+    if push:
+        with metrics.timer('sync_push', log=True):
+            push_snapshot(root)
+    return row_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new HLR records to the cloud snapshot and push it")
+    parser.add_argument('--no-push', action='store_true', help="write the snapshot but skip git commit/push")
+    parser.add_argument('--compact-after', type=int, default=COMPACT_AFTER,
+                        help="segments today may have before they are merged (default: %(default)s)")
+    args = parser.parse_args()
+    fetch_and_push_data(push=not args.no_push, compact_after=args.compact_after)
 
 if __name__ == "__main__":
-    fetch_and_push_data()
\ No newline at end of file
+    main()
@@ -0,0 +1,23 @@
+import mysql.connector
+
+DB_CONFIG = {
+    'host': 'mysql',
+    'user': 'hlruser',
+    'password': 'hlrpass',
+    'database': 'HLRDB'
+}
+
+def get_connection(**overrides):
+    return mysql.connector.connect(**{**DB_CONFIG, **overrides})
+
+def bump_version(cursor):
+    # Every transaction that changes hlr_verification ends with this. The single version row stays locked
+    # until the commit, so versions are handed out in commit order, which concurrent loaders' ids are not
+    cursor.execute("UPDATE hlr_ingest_version SET version = LAST_INSERT_ID(version + 1) WHERE id = 1")
+    cursor.execute("SELECT LAST_INSERT_ID()")
+    return cursor.fetchone()[0]
+
+def get_version(cursor):
+    cursor.execute("SELECT version FROM hlr_ingest_version WHERE id = 1")
+    row = cursor.fetchone()
+    return row[0] if row else 0
@@ -0,0 +1,130 @@
+import csv
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from hlr_frame import frame_from_table
+
+# Exports are written chunk by chunk to a spool file, so writing one takes a chunk of memory whatever the
+# row count. Handing the file to st.download_button does not: Streamlit reads it whole into its in-memory
+# media store. serve() streams spooled files over plain HTTP instead, for dashboards that set HLR_EXPORT_URL.
+EXPORT_PATH = os.path.join(tempfile.gettempdir(), 'hlr_exports')
+CHUNK_SIZE = 10000
+EXPORT_TTL = 3600
+EXPORT_HOST = os.environ.get('HLR_EXPORT_HOST', '127.0.0.1')
+EXPORT_PORT = 8503
+# Where the browser reaches serve(); unset means exports go through st.download_button
+EXPORT_URL = os.environ.get('HLR_EXPORT_URL')
+# Parquet types of the dashboard's export columns; anything not listed is written as a string
+COLUMN_TYPES = {'id': 'int64', 'recon_status': 'int8', 'record_timestamp': 'timestamp[s]', 'hlr_found': 'bool'}
+MIME_TYPES = {
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+def iter_frame_chunks(df, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(df), chunk_size):
+        yield list(df.iloc[start:start + chunk_size].itertuples(index=False, name=None))
+
+def iter_table_chunks(table, indices, chunk_size=CHUNK_SIZE):
+    # Rows of an Arrow table in indices order; only one chunk at a time is taken out and converted to pandas
+    for start in range(0, len(indices), chunk_size):
+        yield from iter_frame_chunks(frame_from_table(table.take(indices[start:start + chunk_size])), chunk_size)
+
+def cleanup_exports(max_age=EXPORT_TTL):
+    if not os.path.isdir(EXPORT_PATH):
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(EXPORT_PATH):
+        path = os.path.join(EXPORT_PATH, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+def write_csv(chunks, columns, f, progress):
+    writer = csv.writer(f)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        progress(len(rows))
+
+def parquet_schema(columns, schema=None):
+    import pyarrow as pa
+    if schema is None:
+        schema = pa.schema([(column, pa.type_for_alias(COLUMN_TYPES.get(column, 'string'))) for column in columns])
+    # Categorical columns arrive as dictionaries whose index width depends on the frame; plain values are safer
+    return pa.schema([field.with_type(field.type.value_type) if pa.types.is_dictionary(field.type) else field
+                      for field in (schema.field(column) for column in columns)])
+
+def write_parquet(chunks, columns, path, progress, schema=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs the pyarrow package installed")
+    # Fixed up front: a chunk where a column is all NULL would otherwise pin it to the null type
+    schema = parquet_schema(columns, schema)
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        for rows in chunks:
+            if not rows:
+                continue
+            # One row group per chunk
+            writer.write_table(pa.Table.from_arrays(
+                [pa.array(values, type=field.type, from_pandas=True) for values, field in zip(zip(*rows), schema)],
+                schema=schema
+            ))
+            progress(len(rows))
+
+def write_export(chunks, columns, fmt='csv', total_rows=None, progress=None, prefix='hlr_data', schema=None):
+    """Spool chunks of row tuples to a new export file; schema (pyarrow) overrides COLUMN_TYPES for Parquet."""
+    os.makedirs(EXPORT_PATH, exist_ok=True)
+    cleanup_exports()
+    fd, path = tempfile.mkstemp(dir=EXPORT_PATH, prefix=f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_",
+                                suffix=f".{fmt}")
+    written = 0
+
+    def advance(rows):
+        nonlocal written
+        written += rows
+        if progress:
+            progress(written, total_rows)
+
+    try:
+        if fmt == 'parquet':
+            os.close(fd)
+            write_parquet(chunks, columns, path, advance, schema)
+        else:
+            with os.fdopen(fd, 'w', newline='') as f:
+                write_csv(chunks, columns, f, advance)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, written
+
+class ExportHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        name = os.path.basename(self.path.split('?')[0])
+        path = os.path.join(EXPORT_PATH, name)
+        fmt = os.path.splitext(name)[1].lstrip('.')
+        if not name or fmt not in MIME_TYPES or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', MIME_TYPES[fmt])
+            self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+            self.send_header('Content-Disposition', f'attachment; filename="{name}"')
+            self.end_headers()
+            shutil.copyfileobj(f, self.wfile, 1 << 20)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=EXPORT_PORT, host=EXPORT_HOST):
+    """Serve spooled exports by file name from a daemon thread; mkstemp's random names keep them unguessable."""
+    server = ThreadingHTTPServer((host, port), ExportHandler)
+    threading.Thread(target=server.serve_forever, name='exports', daemon=True).start()
+    return server
@@ -0,0 +1,154 @@
+import json
+import re
+from itertools import repeat
+
+import numpy as np
+
+COLUMNS = ('operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi')
+NOT_FOUND_MARKER = 'NO DATA FOUND'
+
+# Reconciliation of the HLR side against the BSS side, stored per row as recon_status
+RECON_MATCHED = 0
+RECON_MISSING_IN_HLR = 1
+RECON_MSISDN_MISMATCH = 2
+RECON_IMSI_MISMATCH = 3
+RECON_LABELS = ('matched', 'missing_in_hlr', 'msisdn_mismatch', 'imsi_mismatch')
+# After these the HLR should hold a new MSISDN for the same IMSI; every other operation expects both to match
+MSISDN_CHANGING_OPERATIONS = ('CHANGEMSISDN',)
+
+# The verify job writes one compact object per line in a fixed key order; matching that shape directly
+# skips building nested dicts. Anything else (extra entries, escapes, reordered keys) goes through json.
+LINE_PATTERN = re.compile(
+    r'\{"operation":"([^"\\]*)",'
+    r'"BSS":\[(?:\{"msisdn_no":"([^"\\]*)","imsi_no":"([^"\\]*)"\})?\],'
+    r'"HLR":\[(?:\{"msisdn_no":"([^"\\]*)","imsi_no":"([^"\\]*)"\})?\]\}'
+)
+
+class DecodedBatch:
+    def __init__(self):
+        self.operation = []
+        self.bss_msisdn = []
+        self.bss_imsi = []
+        self.hlr_msisdn = []
+        self.hlr_imsi = []
+        self.hlr_found = []
+        self.recon_status = []
+        self.lines = 0
+        self.malformed = 0
+        self.empty_bss = 0
+        self.empty_hlr = 0
+
+    def __len__(self):
+        return len(self.operation)
+
+    def columns(self):
+        self.reconcile()
+        return {column: getattr(self, column) for column in COLUMNS + ('hlr_found', 'recon_status')}
+
+    def rows(self, *extra):
+        # Row tuples in COLUMNS order plus recon_status, with constant trailing values (e.g. file_name) appended
+        self.reconcile()
+        return list(zip(*(getattr(self, column) for column in COLUMNS), self.recon_status,
+                        *(repeat(value) for value in extra)))
+
+    def reconcile(self):
+        if len(self.recon_status) != len(self):
+            self.recon_status = reconcile(self).tolist()
+        return self.recon_status
+
+    def append(self, operation, bss_msisdn, bss_imsi, hlr_msisdn, hlr_imsi):
+        self.operation.append(operation)
+        self.bss_msisdn.append(bss_msisdn)
+        self.bss_imsi.append(bss_imsi)
+        self.hlr_msisdn.append(hlr_msisdn)
+        self.hlr_imsi.append(hlr_imsi)
+        self.hlr_found.append(bool(hlr_msisdn) and NOT_FOUND_MARKER not in hlr_msisdn)
+
+def reconcile(batch):
+    """recon_status for every row of the batch, as an int8 array, from whole-column comparisons."""
+    operation = np.array(batch.operation, dtype=object)
+    bss_msisdn = np.array(batch.bss_msisdn, dtype=object)
+    hlr_msisdn = np.array(batch.hlr_msisdn, dtype=object)
+    bss_imsi = np.array(batch.bss_imsi, dtype=object)
+    hlr_imsi = np.array(batch.hlr_imsi, dtype=object)
+
+    status = np.full(len(batch), RECON_MATCHED, dtype=np.int8)
+    # Applied from least to most severe, so each row keeps the most severe finding
+    status[(bss_msisdn == hlr_msisdn) == np.isin(operation, MSISDN_CHANGING_OPERATIONS)] = RECON_MSISDN_MISMATCH
+    status[bss_imsi != hlr_imsi] = RECON_IMSI_MISMATCH
+    status[~np.array(batch.hlr_found, dtype=bool)] = RECON_MISSING_IN_HLR
+    return status
+
+def number_field(value):
+    # Subscriber numbers are strings in the verify job's output; a bare JSON integer is the same number,
+    # a missing or null one is empty, and anything else makes the line malformed
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return value
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    raise TypeError(f"unexpected subscriber number {value!r}")
+
+def decode_json_line(line, batch):
+    try:
+        data = json.loads(line)
+        operation = data['operation']
+        if not isinstance(operation, str) or not operation:
+            # hlr_hourly_rollup.operation is NOT NULL, and a row without an operation cannot be reconciled
+            raise ValueError(f"unexpected operation {operation!r}")
+        bss_data = data['BSS'][0] if data['BSS'] else {}
+        hlr_data = data['HLR'][0] if data['HLR'] else {}
+        values = (
+            operation,
+            number_field(bss_data.get('msisdn_no')),
+            number_field(bss_data.get('imsi_no')),
+            number_field(hlr_data.get('msisdn_no')),
+            number_field(hlr_data.get('imsi_no'))
+        )
+    except (ValueError, KeyError, IndexError, TypeError, AttributeError):
+        batch.malformed += 1
+        return
+    batch.empty_bss += not bss_data
+    batch.empty_hlr += not hlr_data
+    batch.append(*values)
+
+def decode_lines(lines, batch=None):
+    """Decode raw hlrout lines (bytes or str) into column lists, counting rather than raising on bad lines."""
+    batch = batch if batch is not None else DecodedBatch()
+    match = LINE_PATTERN.fullmatch
+    operation, bss_msisdn, bss_imsi = batch.operation.append, batch.bss_msisdn.append, batch.bss_imsi.append
+    hlr_msisdn, hlr_imsi, hlr_found = batch.hlr_msisdn.append, batch.hlr_imsi.append, batch.hlr_found.append
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.strip()
+        if not line:
+            continue
+        batch.lines += 1
+        m = match(line)
+        if m is None:
+            decode_json_line(line, batch)
+            continue
+        values = m.groups('')
+        operation(values[0])
+        bss_msisdn(values[1])
+        bss_imsi(values[2])
+        hlr_msisdn(values[3])
+        hlr_imsi(values[4])
+        hlr_found(bool(values[3]) and NOT_FOUND_MARKER not in values[3])
+        if m.start(2) < 0:
+            batch.empty_bss += 1
+        if m.start(4) < 0:
+            batch.empty_hlr += 1
+    return batch
+
+def iter_batches(lines, batch_size):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= batch_size:
+            yield decode_lines(chunk)
+            chunk = []
+    if chunk:
+        yield decode_lines(chunk)
@@ -0,0 +1,61 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from hlr_decoder import NOT_FOUND_MARKER, RECON_LABELS
+
+CATEGORY_COLUMNS = ('operation', 'source', 'file_name')
+NUMBER_COLUMNS = ('bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi')
+
+def hlr_found_mask(hlr_msisdn):
+    # Vectorised equivalent of the dashboards' old per-row 'NO DATA FOUND' not in str(x) check
+    values = hlr_msisdn.astype('string')
+    return (values.notna() & (values != '') & ~values.str.contains(NOT_FOUND_MARKER, regex=False)).fillna(False).astype(bool)
+
+def to_compact_frame(data):
+    """Dashboard frame with categorical labels, nullable int64 subscriber numbers and one boolean hlr_found."""
+    df = data.copy() if isinstance(data, pd.DataFrame) else pd.DataFrame(data)
+
+    if 'hlr_found' in df.columns:
+        df['hlr_found'] = df['hlr_found'].astype(bool)
+    elif 'hlr_msisdn' in df.columns:
+        df['hlr_found'] = hlr_found_mask(df['hlr_msisdn'])
+
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns:
+            values = df[column].astype('category')
+            # Lexical category order, so sorting on the column sorts by name whichever source built it
+            df[column] = values.cat.reorder_categories(sorted(values.cat.categories))
+    if 'recon_status' in df.columns and not isinstance(df['recon_status'].dtype, pd.CategoricalDtype):
+        df['recon_status'] = recon_label(df['recon_status'])
+    # Placeholders such as 'HLR MSISDN NO DATA FOUND' become <NA>; hlr_found keeps that information
+    for column in NUMBER_COLUMNS:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce', dtype_backend='numpy_nullable').astype('Int64')
+    return df
+
+def frame_from_table(table):
+    # Arrow dictionaries arrive as categoricals; nullable int64 stays Int64 instead of falling back to float
+    return table.to_pandas(types_mapper={pa.int64(): pd.Int64Dtype()}.get)
+
+def table_order(table, column, descending=False):
+    """Row indices that sort the Arrow table on one column, stably, without converting it to pandas."""
+    values = table[column]
+    if pa.types.is_dictionary(values.type):
+        # pyarrow cannot sort dictionary arrays, so sort on each row's rank within one shared dictionary
+        values = values.unify_dictionaries()
+        ranks = pc.rank(values.chunk(0).dictionary) if values.num_chunks else pa.array([], pa.uint64())
+        values = pa.chunked_array([ranks.take(chunk.indices) for chunk in values.chunks], pa.uint64())
+    return pc.sort_indices(values, sort_keys=[('', 'descending' if descending else 'ascending')])
+
+def count_frame(df):
+    """Record counts per file, operation and hlr_found: everything the dashboard charts need, in a few hundred rows."""
+    keys = [column for column in ('file_name', 'operation', 'hlr_found') if column in df.columns]
+    return df.groupby(keys, observed=True).size().reset_index(name='count')
+
+def hlr_status(hlr_found):
+    return hlr_found.map({True: 'Data Found', False: 'No Data Found'}).astype('category')
+
+def recon_label(recon_status):
+    codes = pd.to_numeric(recon_status).fillna(-1).astype('int64')
+    return pd.Categorical.from_codes(codes, categories=list(RECON_LABELS))
@@ -1,69 +1,1142 @@
+import argparse
+import asyncio
+import csv
+import glob
+import gzip
+import hashlib
 import json
-import mysql.connector
 import paramiko
 import os
-from datetime import datetime
+import queue
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 
-def connect_to_server():
+from mysql.connector import errorcode
+
+import live_monitor
+import metrics
+from db import bump_version, get_connection
+from hlr_decoder import NOT_FOUND_MARKER, RECON_MATCHED, decode_lines
+from hll import HyperLogLog
+
+REMOTE_PATH = '/apps/jboss-5.1.0.GA/server/HKsmfagent/HLRVERIFYJOBPDF/'
+LOCAL_PATH = './data'
+AGENTS_FILE = 'agents.json'
+DEFAULT_SOURCE = 'default'
+ARCHIVE_PATH = './archive'
+STREAM_BUFSIZE = 1 << 20
+
+BATCH_SIZE = 5000
+LOAD_MODES = ('multirow', 'load-data', 'row')
+INSERT_COLUMNS = ('operation, bss_msisdn, bss_imsi, hlr_msisdn, hlr_imsi, recon_status, source, file_name, '
+                  'record_timestamp')
+ROW_PLACEHOLDERS = '%s, %s, %s, %s, %s, %s, %s, %s, %s'
+
+DOWNLOAD_WORKERS = 4
+PARSE_WORKERS = 2
+QUEUE_SIZE = 8
+FOLLOW_INTERVAL = 15
+AGENT_RETRIES = 2
+AGENT_RETRY_DELAY = 30
+BACKFILL_PROCESSES = os.cpu_count() or 1
+BACKFILL_WRITERS = 2
+SKETCH_COLUMNS = ('bss_msisdn', 'bss_imsi', 'hlr_msisdn')
+SKETCH_RETRIES = 3
+FAILURE_RETRIES = 5
+
+SEARCH_COLUMNS = ('id', 'record_timestamp', 'operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi', 'recon_status',
+                  'source', 'file_name')
+SUBSCRIBER_COLUMNS = ('bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi')
+PREFIX_COLUMNS = {'MSISDN': ('bss_msisdn', 'hlr_msisdn'), 'IMSI': ('bss_imsi', 'hlr_imsi')}
+SEARCH_LIMIT = 500
+# Every MSISDN here starts with the country code and every IMSI with the MCC-MNC, so a prefix only
+# narrows the match once it runs well past them: 6 more digits for an MSISDN, 5 for an IMSI
+MSISDN_HOME = '60'
+IMSI_HOME = '50219'
+MIN_PREFIX = {'MSISDN': len(MSISDN_HOME) + 6, 'IMSI': len(IMSI_HOME) + 5}
+
+# Called as listener(counts, file, source) after each ingest commit, with the rows it added as
+# {(operation, hlr_found): rows}, e.g. live_monitor.Monitor.record
+BATCH_LISTENERS = []
+
+# Local stand-in for paramiko.SFTPAttributes, so archived files share the manifest helpers
+FileAttr = namedtuple('FileAttr', ['filename', 'st_size', 'st_mtime'])
+
+# One JBoss agent running the verify job; name is what its rows are tagged with in the source column
+Agent = namedtuple('Agent', ['name', 'host', 'port', 'username', 'password', 'remote_path'])
+DEFAULT_AGENT = Agent(DEFAULT_SOURCE, '10.63.11.11', 22, 'jboss', 'jboss', REMOTE_PATH)
+
+def load_agents(path=AGENTS_FILE):
+    # agents.json is a list of objects with Agent's fields; anything left out falls back to the default agent's
+    if not os.path.exists(path):
+        return [DEFAULT_AGENT]
+    with open(path) as f:
+        agents = [DEFAULT_AGENT._replace(**entry) for entry in json.load(f)]
+    names = [agent.name for agent in agents]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: agent names must be unique")
+    return agents
+
+def connect_to_server(agent=DEFAULT_AGENT):
     ssh = paramiko.SSHClient()
     ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect('10.63.11.11', username='jboss', password='jboss')
+    ssh.connect(agent.host, port=agent.port, username=agent.username, password=agent.password)
     return ssh
 
-def get_hlr_files(ssh):
-    sftp = ssh.open_sftp()
-    remote_path = '/apps/jboss-5.1.0.GA/server/HKsmfagent/HLRVERIFYJOBPDF/'
-    files = sftp.listdir(remote_path)
-    
-    hlr_files = [f for f in files if f.startswith('hlrout_')]
-    
-    for file in hlr_files:
-        sftp.get(f"{remote_path}{file}", f"./data/{file}")
-    
-    sftp.close()
-    return hlr_files
-
-def parse_and_insert_data():
-    conn = mysql.connector.connect(
-        host='mysql',
-        user='hlruser',
-        password='hlrpass',
-        database='HLRDB'
-    )
+class SFTPSessionPool:
+    """SFTP channels multiplexed over one kept-alive SSH transport to an agent, reusable across runs.
+
+    size caps the channels open at once, and so how hard each agent is hit.
+    """
+
+    def __init__(self, size=DOWNLOAD_WORKERS, keepalive=30, agent=DEFAULT_AGENT):
+        self.size = size
+        self.agent = agent
+        self.keepalive = keepalive
+        self._ssh = None
+        self._idle = []
+        self._opened = 0
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+
+    def _transport(self):
+        # Called with the lock held; reconnects (and forgets stale channels) if the agent dropped us
+        transport = self._ssh.get_transport() if self._ssh else None
+        if transport is None or not transport.is_active():
+            if self._ssh:
+                self._ssh.close()
+            self._ssh = connect_to_server(self.agent)
+            transport = self._ssh.get_transport()
+            transport.set_keepalive(self.keepalive)
+            self._idle = []
+            self._opened = 0
+        return transport
+
+    @contextmanager
+    def session(self):
+        with self._available:
+            transport = self._transport()
+            while not self._idle and self._opened >= self.size:
+                self._available.wait()
+                transport = self._transport()
+            if self._idle:
+                sftp = self._idle.pop()
+            else:
+                sftp = paramiko.SFTPClient.from_transport(transport)
+                self._opened += 1
+        healthy = False
+        try:
+            yield sftp
+            healthy = True
+        finally:
+            with self._available:
+                if healthy and sftp.get_channel().get_transport() is transport:
+                    self._idle.append(sftp)
+                else:
+                    sftp.close()
+                    if self._ssh and self._ssh.get_transport() is transport:
+                        self._opened -= 1
+                self._available.notify()
+
+    def close(self):
+        with self._lock:
+            for sftp in self._idle:
+                sftp.close()
+            if self._ssh:
+                self._ssh.close()
+            self._ssh = None
+            self._idle = []
+            self._opened = 0
+
+def file_timestamp(file_name, mtime):
+    # hlrout_YYYY-MM-DD_HH-MM.txt, falling back to the remote mtime for anything else
+    try:
+        return datetime.strptime(file_name, 'hlrout_%Y-%m-%d_%H-%M.txt')
+    except ValueError:
+        return datetime.fromtimestamp(mtime)
+
+def load_manifest(cursor, source=DEFAULT_SOURCE):
+    cursor.execute("""
+        SELECT file_name, remote_size, remote_mtime, checksum, row_count, committed_offset
+        FROM hlr_ingest_manifest WHERE source = %s
+    """, (source,))
+    return {row[0]: row[1:] for row in cursor.fetchall()}
+
+def source_path(base, source):
+    # The default agent keeps the original layout; every other agent gets its own subdirectory,
+    # since each region's verify job writes the same hlrout_* names
+    return base if source == DEFAULT_SOURCE else os.path.join(base, source)
+
+def list_pending_files(sftp, manifest, since=None, remote_path=REMOTE_PATH):
+    pending = []
+    for attr in sftp.listdir_attr(remote_path):
+        if not attr.filename.startswith('hlrout_'):
+            continue
+        if since and file_timestamp(attr.filename, attr.st_mtime) < since:
+            continue
+        known = manifest.get(attr.filename)
+        if known and known[0] == attr.st_size and known[1] == attr.st_mtime:
+            continue
+        pending.append(attr)
+    return sorted(pending, key=lambda attr: attr.filename)
+
+def download_file(sftp, attr, agent=DEFAULT_AGENT):
+    with metrics.timer('sftp_get', source=agent.name):
+        sftp.get(f"{agent.remote_path}{attr.filename}", f"{source_path(LOCAL_PATH, agent.name)}/{attr.filename}",
+                 prefetch=True)
+    metrics.count('bytes', attr.st_size, stage='sftp_get', source=agent.name)
+
+def open_remote(sftp, attr, offset=0, remote_path=REMOTE_PATH):
+    f = sftp.open(f"{remote_path}{attr.filename}", 'rb', bufsize=STREAM_BUFSIZE)
+    f.seek(offset)
+    f.prefetch(attr.st_size)
+    return f
+
+@contextmanager
+def open_archive(file_name, archive, source=DEFAULT_SOURCE):
+    # Audit copy of the raw bytes as they stream past; only renamed into place once the load succeeds
+    if archive is None:
+        yield None
+        return
+    archive_path = source_path(ARCHIVE_PATH, source)
+    os.makedirs(archive_path, exist_ok=True)
+    if archive == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("--archive zstd needs the zstandard package installed")
+        path = f"{archive_path}/{file_name}.zst"
+        raw = open(f"{path}.part", 'wb')
+        f = zstandard.ZstdCompressor().stream_writer(raw)
+    else:
+        path = f"{archive_path}/{file_name}.gz"
+        raw = None
+        f = gzip.open(f"{path}.part", 'wb')
+    try:
+        yield f
+    except BaseException:
+        f.close()
+        if raw:
+            raw.close()
+        os.remove(f"{path}.part")
+        raise
+    f.close()
+    if raw:
+        raw.close()
+    os.replace(f"{path}.part", path)
+
+def insert_rows(cursor, rows, load_mode='multirow'):
+    if load_mode == 'row':
+        for row in rows:
+            cursor.execute(f"INSERT INTO hlr_verification ({INSERT_COLUMNS}) VALUES ({ROW_PLACEHOLDERS})", row)
+    elif load_mode == 'load-data':
+        load_data_infile(cursor, rows)
+    else:
+        values = ', '.join([f"({ROW_PLACEHOLDERS})"] * len(rows))
+        params = [value for row in rows for value in row]
+        cursor.execute(f"INSERT INTO hlr_verification ({INSERT_COLUMNS}) VALUES {values}", params)
+
+def load_data_infile(cursor, rows):
+    # mysql.connector can only send LOCAL INFILE data from a path, so stage the batch on tmpfs when available
+    tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+    with tempfile.NamedTemporaryFile('w', suffix='.tsv', dir=tmp_dir, newline='', delete=False) as tmp:
+        csv.writer(tmp, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_NONE, escapechar='\\').writerows(rows)
+    try:
+        cursor.execute(f"""
+            LOAD DATA LOCAL INFILE '{tmp.name}' INTO TABLE hlr_verification
+            FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+            ({INSERT_COLUMNS})
+        """)
+    finally:
+        os.remove(tmp.name)
+
+def update_rollup(cursor, batch, file, hour_start, source=DEFAULT_SOURCE):
+    counts = Counter(zip(batch.operation, batch.hlr_found, batch.reconcile()))
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s, %s)'] * len(counts))
+    params = [value for (operation, hlr_found, recon_status), count in counts.items()
+              for value in (hour_start, operation, source, file, hlr_found, recon_status, count)]
+    cursor.execute(f"""
+        INSERT INTO hlr_hourly_rollup (hour_start, operation, source, file_name, hlr_found, recon_status,
+                                       record_count)
+        VALUES {values}
+        ON DUPLICATE KEY UPDATE record_count = record_count + VALUES(record_count)
+    """, params)
+
+def add_to_failures(failures, batch, file, seen_at):
+    # Running per-subscriber tally of every non-matched verification, so repeat failures are a lookup
+    for msisdn, status in zip(batch.bss_msisdn, batch.reconcile()):
+        if status != RECON_MATCHED and msisdn:
+            tally = failures.get((msisdn, status))
+            failures[(msisdn, status)] = [tally[0] + 1 if tally else 1, file, seen_at]
+
+def update_failures(cursor, failures):
+    # Sorted, so loaders that share subscribers take their row locks in the same order
+    keys = sorted(failures)
+    for start in range(0, len(keys), BATCH_SIZE):
+        chunk = keys[start:start + BATCH_SIZE]
+        cursor.execute(f"""
+            INSERT INTO hlr_subscriber_failures (bss_msisdn, recon_status, failure_count, last_file, last_seen)
+            VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(chunk))}
+            ON DUPLICATE KEY UPDATE failure_count = failure_count + VALUES(failure_count),
+                last_file = COALESCE(VALUES(last_file), last_file), last_seen = COALESCE(VALUES(last_seen), last_seen)
+        """, [value for key in chunk for value in key + tuple(failures[key])])
+        # Subscribers whose only failures were in rows deleted by delete_file_rows drop out
+        emptied = [key for key in chunk if failures[key][0] < 0]
+        if emptied:
+            cursor.execute(f"""
+                DELETE FROM hlr_subscriber_failures WHERE failure_count <= 0
+                AND (bss_msisdn, recon_status) IN ({', '.join(['(%s, %s)'] * len(emptied))})
+            """, [value for key in emptied for value in key])
+
+def merge_failures(conn, cursor, failures, retries=FAILURE_RETRIES):
+    # Applied after the rows commit, in its own short transaction, for the same reason as merge_sketches:
+    # files with overlapping subscribers would otherwise wait on each other's locks for a whole file.
+    # A tally is not idempotent, so it is only retried after a rollback.
+    if not failures:
+        return True
+    for attempt in range(retries):
+        try:
+            update_failures(cursor, failures)
+            conn.commit()
+            return True
+        except Exception as e:
+            conn.rollback()
+            metrics.count('errors', stage='failure_merge')
+            if getattr(e, 'errno', None) not in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT):
+                raise
+            if attempt == retries - 1:
+                print(f"Repeat-failure tally not updated for {len(failures):,} subscribers ({e}); "
+                      f"`python hlr_parser.py failures` rebuilds it")
+    return False
+
+def add_to_monitored(monitored, batch):
+    for key in zip(batch.operation, batch.hlr_found):
+        monitored[key] = monitored.get(key, 0) + 1
+
+def notify_listeners(monitored, file, source=DEFAULT_SOURCE):
+    # Called once the counted rows have committed. Only the positive part is handed over: what stays
+    # negative is rows a reload deleted (see delete_file_rows) that its new rows have not made up yet,
+    # so reloading a growing file reports just the lines appended since the last load.
+    counts = {key: count for key, count in monitored.items() if count > 0}
+    for key in counts:
+        monitored[key] = 0
+    if counts:
+        for listener in BATCH_LISTENERS:
+            listener(counts, file, source)
+
+def add_to_sketches(sketches, hour_start, operations, columns):
+    # Distinct-count sketches per hour, operation and column; placeholders are not subscriber numbers
+    for column, values in columns.items():
+        by_operation = defaultdict(list)
+        for operation, value in zip(operations, values):
+            if value and NOT_FOUND_MARKER not in value:
+                by_operation[operation].append(value)
+        for operation, operation_values in by_operation.items():
+            sketches.setdefault((hour_start, operation, column), HyperLogLog()).add(operation_values)
+
+def merge_sketches(conn, cursor, sketches, retries=SKETCH_RETRIES):
+    # Runs after the rows commit, in its own short transaction, so parallel loaders never hold sketch
+    # row locks for a whole file. Merging is idempotent: a retry, or a file loaded twice, counts nothing twice.
+    if not sketches:
+        return True
+    keys = sorted(sketches)
+    for attempt in range(retries):
+        try:
+            started = time.perf_counter()
+            cursor.execute(f"""
+                SELECT hour_start, operation, column_name, registers FROM hlr_hourly_sketch
+                WHERE (hour_start, operation, column_name) IN ({', '.join(['(%s, %s, %s)'] * len(keys))})
+                FOR UPDATE
+            """, [value for key in keys for value in key])
+            stored = {(hour_start, operation, column): registers
+                      for hour_start, operation, column, registers in cursor.fetchall()}
+            params = []
+            for key in keys:
+                sketch = sketches[key]
+                if key in stored:
+                    sketch = HyperLogLog.from_bytes(stored[key]).merge(sketch)
+                params.extend(key + (sketch.to_bytes(),))
+            cursor.execute(f"""
+                INSERT INTO hlr_hourly_sketch (hour_start, operation, column_name, registers)
+                VALUES {', '.join(['(%s, %s, %s, %s)'] * len(keys))}
+                ON DUPLICATE KEY UPDATE registers = VALUES(registers)
+            """, params)
+            # The dashboard's distinct counts are cached on the ingest version too
+            bump_version(cursor)
+            conn.commit()
+            metrics.observe('sketch_merge', time.perf_counter() - started)
+            return True
+        except Exception as e:
+            conn.rollback()
+            metrics.count('errors', stage='sketch_merge')
+            if getattr(e, 'errno', None) not in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT):
+                raise
+            if attempt == retries - 1:
+                print(f"Distinct-count sketches not updated ({e}); `python hlr_parser.py sketches` rebuilds them")
+    return False
+
+def insert_batch(cursor, batch, file, load_mode='multirow', sketches=None, source=DEFAULT_SOURCE, failures=None,
+                 monitored=None):
+    # Rows are stamped here rather than by the column default so the rollup lands in the same
+    # hour as its rows, and in the same transaction. Failure tallies go to failures for merge_failures
+    # after the commit; without it they are written here. monitored collects counts for notify_listeners.
+    if len(batch):
+        ingested_at = datetime.now().replace(microsecond=0)
+        hour_start = ingested_at.replace(minute=0, second=0)
+        with metrics.timer('insert', source=source, load_mode=load_mode):
+            insert_rows(cursor, batch.rows(source, file, ingested_at), load_mode)
+            update_rollup(cursor, batch, file, hour_start, source)
+            if failures is None:
+                batch_failures = {}
+                add_to_failures(batch_failures, batch, file, ingested_at)
+                update_failures(cursor, batch_failures)
+        if failures is not None:
+            add_to_failures(failures, batch, file, ingested_at)
+        if sketches is not None:
+            add_to_sketches(sketches, hour_start, batch.operation,
+                            {column: getattr(batch, column) for column in SKETCH_COLUMNS})
+        if monitored is not None:
+            add_to_monitored(monitored, batch)
+    return len(batch)
+
+def delete_file_rows(cursor, file, source=DEFAULT_SOURCE, failures=None, monitored=None):
+    # Returns how many rows the file had, so the commit can be logged as replacing them
+    if monitored is not None:
+        # Already reported when they were loaded; the reload's rows make these up before reporting more
+        cursor.execute("""
+            SELECT operation, hlr_found, SUM(record_count) FROM hlr_hourly_rollup
+            WHERE file_name = %s AND source = %s GROUP BY operation, hlr_found
+        """, (file, source))
+        for operation, hlr_found, count in cursor.fetchall():
+            key = (operation, bool(hlr_found))
+            monitored[key] = monitored.get(key, 0) - int(count)
+    if failures is not None:
+        # Taken back out of the tally by merge_failures after the commit, like the file's new failures
+        cursor.execute("""
+            SELECT bss_msisdn, recon_status, COUNT(*) FROM hlr_verification
+            WHERE file_name = %s AND source = %s AND recon_status <> %s AND bss_msisdn <> ''
+            GROUP BY bss_msisdn, recon_status
+        """, (file, source, RECON_MATCHED))
+        for msisdn, status, count in cursor.fetchall():
+            tally = failures.get((msisdn, status)) or [0, None, None]
+            failures[(msisdn, status)] = [tally[0] - count] + tally[1:]
+        cursor.execute("DELETE FROM hlr_verification WHERE file_name = %s AND source = %s", (file, source))
+        deleted = cursor.rowcount
+        cursor.execute("DELETE FROM hlr_hourly_rollup WHERE file_name = %s AND source = %s", (file, source))
+        return deleted
+    cursor.execute("""
+        UPDATE hlr_subscriber_failures f
+        JOIN (
+            SELECT bss_msisdn, recon_status, COUNT(*) AS failures FROM hlr_verification
+            WHERE file_name = %s AND source = %s AND recon_status <> %s AND bss_msisdn <> ''
+            GROUP BY bss_msisdn, recon_status
+        ) d USING (bss_msisdn, recon_status)
+        SET f.failure_count = f.failure_count - d.failures
+    """, (file, source, RECON_MATCHED))
+    cursor.execute("DELETE FROM hlr_subscriber_failures WHERE failure_count <= 0")
+    cursor.execute("DELETE FROM hlr_verification WHERE file_name = %s AND source = %s", (file, source))
+    deleted = cursor.rowcount
+    cursor.execute("DELETE FROM hlr_hourly_rollup WHERE file_name = %s AND source = %s", (file, source))
+    return deleted
+
+def log_commit(cursor, file, source=DEFAULT_SOURCE, replaced=False):
+    # Last statement before every ingest commit: records the ids this transaction wrote for the file under
+    # a commit-ordered version, which is what data_sync exports by. Only one loader has a file at a time,
+    # so everything past the file's previous range is this transaction's. replaced marks a transaction that
+    # deleted the file's earlier rows, so the snapshot drops them too.
+    cursor.execute("SELECT COALESCE(MAX(last_id), 0) FROM hlr_ingest_commits WHERE source = %s AND file_name = %s",
+                   (source, file))
+    previous = cursor.fetchone()[0]
+    cursor.execute("SELECT MIN(id), MAX(id) FROM hlr_verification WHERE file_name = %s AND source = %s AND id > %s",
+                   (file, source, previous))
+    first_id, last_id = cursor.fetchone()
+    version = bump_version(cursor)
+    if first_id is not None or replaced:
+        cursor.execute("""
+            INSERT INTO hlr_ingest_commits (version, source, file_name, first_id, last_id, replaced)
+            VALUES (%s, %s, %s, %s, %s, %s)
+        """, (version, source, file, first_id, last_id, replaced))
+    return version
+
+def insert_file(conn, cursor, file, f, batch_size=BATCH_SIZE, load_mode='multirow', commit_every='file',
+                archive=None, complete_lines_only=False, sketches=None, source=DEFAULT_SOURCE, failures=None,
+                monitored=None):
+    md5 = hashlib.md5()
+    row_count = 0
+    malformed = 0
+    consumed = 0
+    chunk = []
+    for raw in f:
+        if complete_lines_only and not raw.endswith(b'\n'):
+            # The verify job is still writing this line; it is picked up from the checkpoint next poll
+            break
+        consumed += len(raw)
+        md5.update(raw)
+        if archive:
+            archive.write(raw)
+        chunk.append(raw)
+        if len(chunk) >= batch_size:
+            with metrics.timer('parse', source=source):
+                batch = decode_lines(chunk)
+            chunk = []
+            row_count += insert_batch(cursor, batch, file, load_mode, sketches, source, failures, monitored)
+            malformed += batch.malformed
+            if commit_every == 'batch':
+                with metrics.timer('commit', source=source):
+                    log_commit(cursor, file, source)
+                    conn.commit()
+                if failures:
+                    # Each committed batch's tally goes in with it, so a load that dies mid-file leaves it consistent
+                    merge_failures(conn, cursor, failures)
+                    failures.clear()
+                if monitored is not None:
+                    notify_listeners(monitored, file, source)
+    if chunk:
+        with metrics.timer('parse', source=source):
+            batch = decode_lines(chunk)
+        row_count += insert_batch(cursor, batch, file, load_mode, sketches, source, failures, monitored)
+        malformed += batch.malformed
+    metrics.count('rows', row_count, source=source)
+    metrics.count('bytes', consumed, stage='load', source=source)
+    metrics.count('malformed_lines', malformed, source=source)
+    if malformed:
+        print(f"{source_label(source)}{file}: skipped {malformed:,} malformed lines")
+    return row_count, md5.hexdigest(), consumed
+
+def record_manifest(cursor, attr, checksum, row_count, committed_offset, source=DEFAULT_SOURCE):
+    cursor.execute("""
+        INSERT INTO hlr_ingest_manifest
+        (source, file_name, remote_size, remote_mtime, checksum, row_count, committed_offset)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            remote_size = VALUES(remote_size),
+            remote_mtime = VALUES(remote_mtime),
+            checksum = VALUES(checksum),
+            row_count = VALUES(row_count),
+            committed_offset = VALUES(committed_offset),
+            ingested_at = CURRENT_TIMESTAMP
+    """, (source, attr.filename, attr.st_size, attr.st_mtime, checksum, row_count, committed_offset))
+
+def load_file(conn, cursor, attr, f, replace, batch_size=BATCH_SIZE, load_mode='multirow', commit_every='file',
+              archive=None, source=DEFAULT_SOURCE):
+    started = time.perf_counter()
+    with metrics.timer('load_file', log=True, source=source) as fields:
+        fields['file'] = attr.filename
+        sketches, failures, monitored = {}, {}, {}
+        # A changed file is re-read in full, and a per-batch commit may have left part of
+        # a file behind, so drop whatever an earlier run loaded from it first
+        replaced = False
+        if replace or commit_every == 'batch':
+            replaced = delete_file_rows(cursor, attr.filename, source, failures, monitored) > 0
+            if replaced and commit_every == 'batch':
+                # The batches commit one by one anyway; the deletion goes first, as its own logged commit
+                log_commit(cursor, attr.filename, source, replaced)
+                conn.commit()
+                merge_failures(conn, cursor, failures)
+                failures.clear()
+                replaced = False
+        with open_archive(attr.filename, archive, source) as archive_file:
+            row_count, checksum, consumed = insert_file(conn, cursor, attr.filename, f, batch_size, load_mode,
+                                                        commit_every, archive_file, sketches=sketches, source=source,
+                                                        failures=failures, monitored=monitored)
+        record_manifest(cursor, attr, checksum, row_count, consumed, source)
+        with metrics.timer('commit', source=source):
+            log_commit(cursor, attr.filename, source, replaced)
+            conn.commit()
+        notify_listeners(monitored, attr.filename, source)
+        merge_failures(conn, cursor, failures)
+        merge_sketches(conn, cursor, sketches)
+        fields.update(rows=row_count, bytes=consumed)
+    print(f"{source_label(source)}{attr.filename}: {row_count:,} rows ({rate(row_count, started):,.0f} rows/s)")
+    return row_count
+
+def follow_file(conn, cursor, attr, f, known, offset, batch_size=BATCH_SIZE, load_mode='multirow',
+                source=DEFAULT_SOURCE, **_):
+    # Only the bytes appended since the committed offset are read, and the new offset is
+    # committed in the same transaction as their rows, so each line lands exactly once
+    started = time.perf_counter()
+    with metrics.timer('follow_file', log=True, source=source) as fields:
+        fields['file'] = attr.filename
+        previous_rows = known[3] if known and offset else 0
+        sketches, failures, monitored = {}, {}, {}
+        replaced = False
+        if known and not offset and known[4]:
+            # Truncated or replaced since the last checkpoint: reload from the start
+            replaced = delete_file_rows(cursor, attr.filename, source, failures, monitored) > 0
+        row_count, _, consumed = insert_file(conn, cursor, attr.filename, f, batch_size, load_mode,
+                                             complete_lines_only=True, sketches=sketches, source=source,
+                                             failures=failures, monitored=monitored)
+        record_manifest(cursor, attr, None, previous_rows + row_count, offset + consumed, source)
+        with metrics.timer('commit', source=source):
+            log_commit(cursor, attr.filename, source, replaced)
+            conn.commit()
+        notify_listeners(monitored, attr.filename, source)
+        merge_failures(conn, cursor, failures)
+        merge_sketches(conn, cursor, sketches)
+        fields.update(rows=row_count, offset=offset + consumed)
+    if row_count:
+        print(f"{source_label(source)}{attr.filename}: +{row_count:,} rows at offset {offset + consumed:,} "
+              f"({rate(row_count, started):,.0f} rows/s)")
+    return row_count
+
+def run_pipeline(pool, files, manifest, download_workers=DOWNLOAD_WORKERS, parse_workers=PARSE_WORKERS,
+                 queue_size=QUEUE_SIZE, stream=False, follow=False, agent=DEFAULT_AGENT, **load_options):
+    # Downloaders feed a bounded queue that parser workers drain as soon as each file lands,
+    # so a slow database holds back the downloads instead of filling the disk. When streaming,
+    # there is nothing to stage: parser workers read straight from their own SFTP channel.
+    pending = queue.Queue()
+    for attr in files:
+        pending.put(attr)
+    downloaded = queue.Queue(maxsize=queue_size)
+    if stream or follow:
+        download_workers = 0
+        downloaded = pending
+    results = {'rows': 0, 'loaded': [], 'failed': []}
+    results_lock = threading.Lock()
+    connect_errors = []
+    load_options['source'] = agent.name
+
+    def fail(attr, error):
+        print(f"{source_label(agent.name)}{attr.filename}: failed ({error})")
+        with results_lock:
+            results['failed'].append(attr)
+
+    def download():
+        while True:
+            try:
+                attr = pending.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                with pool.session() as sftp:
+                    download_file(sftp, attr, agent)
+            except Exception as e:
+                fail(attr, e)
+                continue
+            downloaded.put(attr)
+
+    def parse():
+        try:
+            conn = get_connection(allow_local_infile=(load_options.get('load_mode') == 'load-data'))
+        except Exception as e:
+            # This worker can only fail its share of the files, but it keeps taking them so the
+            # downloaders never block on a full queue
+            metrics.count('errors', stage='connect', source=agent.name)
+            with results_lock:
+                connect_errors.append(e)
+            while True:
+                attr = downloaded.get()
+                if attr is None:
+                    return
+                fail(attr, e)
+        cursor = conn.cursor()
+        try:
+            while True:
+                attr = downloaded.get()
+                if attr is None:
+                    return
+                try:
+                    known = manifest.get(attr.filename)
+                    replace = known is not None
+                    if follow:
+                        offset = known[4] if known and known[4] <= attr.st_size else 0
+                        with pool.session() as sftp, open_remote(sftp, attr, offset, agent.remote_path) as f:
+                            row_count = follow_file(conn, cursor, attr, f, known, offset, **load_options)
+                    elif stream:
+                        with pool.session() as sftp, open_remote(sftp, attr, 0, agent.remote_path) as f:
+                            row_count = load_file(conn, cursor, attr, f, replace, **load_options)
+                    else:
+                        with open(f"{source_path(LOCAL_PATH, agent.name)}/{attr.filename}", 'rb') as f:
+                            row_count = load_file(conn, cursor, attr, f, replace, **load_options)
+                except Exception as e:
+                    conn.rollback()
+                    fail(attr, e)
+                    continue
+                with results_lock:
+                    results['rows'] += row_count
+                    results['loaded'].append(attr)
+        finally:
+            cursor.close()
+            conn.close()
+
+    downloaders = [threading.Thread(target=download, daemon=True) for _ in range(download_workers)]
+    parsers = [threading.Thread(target=parse, daemon=True) for _ in range(parse_workers)]
+    for thread in downloaders + parsers:
+        thread.start()
+    for thread in downloaders:
+        thread.join()
+    for _ in parsers:
+        downloaded.put(None)
+    for thread in parsers:
+        thread.join()
+    if parsers and len(connect_errors) == len(parsers):
+        # Nothing could be loaded; raised so the caller's retry and backoff see the cause
+        raise connect_errors[0]
+    return results
+
+def ingest_agent(agent, pool, since=None, download_workers=DOWNLOAD_WORKERS, parse_workers=PARSE_WORKERS,
+                 stream=False, follow=False, **load_options):
+    # One pass over one agent: list what changed since its manifest and run it through the pipeline
+    conn = get_connection()
+    cursor = conn.cursor()
+    manifest = load_manifest(cursor, agent.name)
+    cursor.close()
+    conn.close()
+
+    stream = stream or follow
+    if not stream:
+        os.makedirs(source_path(LOCAL_PATH, agent.name), exist_ok=True)
+    with metrics.timer('sftp_list', log=True, source=agent.name) as fields, pool.session() as sftp:
+        files = list_pending_files(sftp, manifest, since, agent.remote_path)
+        fields['pending'] = len(files)
+    started = time.perf_counter()
+    results = run_pipeline(pool, files, manifest, download_workers, parse_workers, stream=stream, follow=follow,
+                           agent=agent, **load_options)
+    if files:
+        print(f"{source_label(agent.name)}Loaded {results['rows']:,} rows from {len(results['loaded'])} files "
+              f"({rate(results['rows'], started):,.0f} rows/s), {len(results['failed'])} failed")
+    return results
+
+def parse_and_insert_data(since=None, pool=None, download_workers=DOWNLOAD_WORKERS, parse_workers=PARSE_WORKERS,
+                          stream=False, follow=False, agent=DEFAULT_AGENT, **load_options):
+    own_pool = pool is None
+    if own_pool:
+        pool = SFTPSessionPool(size=parse_workers if stream or follow else download_workers, agent=agent)
+    try:
+        results = ingest_agent(agent, pool, since, download_workers, parse_workers, stream, follow, **load_options)
+    finally:
+        if own_pool:
+            pool.close()
+    return results['loaded']
+
+async def ingest_agent_async(agent, pool, retries=AGENT_RETRIES, retry_delay=AGENT_RETRY_DELAY, **options):
+    # Each agent lists, loads and retries on its own: an unreachable region backs off without holding up
+    # the others, and a retry only relists that agent, which skips the files it already loaded
+    results = {'rows': 0, 'loaded': [], 'failed': [], 'error': None}
+    for attempt in range(retries + 1):
+        try:
+            attempt_results = await asyncio.to_thread(ingest_agent, agent, pool, **options)
+        except Exception as e:
+            results['error'] = e
+            print(f"{agent.name}: failed ({e})")
+        else:
+            results['rows'] += attempt_results['rows']
+            results['loaded'] += attempt_results['loaded']
+            results['failed'] = attempt_results['failed']
+            results['error'] = None
+            if not results['failed']:
+                break
+        if attempt < retries:
+            delay = retry_delay * 2 ** attempt
+            print(f"{agent.name}: retrying in {delay:g}s ({attempt + 1} of {retries})")
+            await asyncio.sleep(delay)
+    return results
+
+async def ingest_agents_async(agents, pools, retries=AGENT_RETRIES, retry_delay=AGENT_RETRY_DELAY, **options):
+    # The blocking SFTP and MySQL work runs in threads; gathering them makes a run as long as the slowest agent
+    results = await asyncio.gather(*(ingest_agent_async(agent, pools[agent.name], retries, retry_delay, **options)
+                                     for agent in agents))
+    return {agent.name: agent_results for agent, agent_results in zip(agents, results)}
+
+def ingest_agents(agents=None, pools=None, since=None, download_workers=DOWNLOAD_WORKERS, parse_workers=PARSE_WORKERS,
+                  stream=False, follow=False, retries=AGENT_RETRIES, retry_delay=AGENT_RETRY_DELAY, **load_options):
+    """Ingest from every agent concurrently; returns each agent's {'rows', 'loaded', 'failed', 'error'} by name.
+
+    download_workers and parse_workers apply per agent, so each host sees the same load it would on its own.
+    """
+    agents = agents or load_agents()
+    own_pools = pools is None
+    if own_pools:
+        size = parse_workers if stream or follow else download_workers
+        pools = {agent.name: SFTPSessionPool(size=size, agent=agent) for agent in agents}
+    started = time.perf_counter()
+    try:
+        results = asyncio.run(ingest_agents_async(
+            agents, pools, retries, retry_delay, since=since, download_workers=download_workers,
+            parse_workers=parse_workers, stream=stream, follow=follow, **load_options
+        ))
+    finally:
+        if own_pools:
+            for pool in pools.values():
+                pool.close()
+
+    if len(agents) > 1:
+        for name, agent_results in results.items():
+            if agent_results['error']:
+                print(f"{name}: unreachable ({agent_results['error']})")
+            else:
+                print(f"{name}: {agent_results['rows']:,} rows from {len(agent_results['loaded'])} files, "
+                      f"{len(agent_results['failed'])} failed")
+        print(f"All agents done in {time.perf_counter() - started:.1f}s")
+    return results
+
+def follow_hlr_files(poll_interval=FOLLOW_INTERVAL, since=None, parse_workers=PARSE_WORKERS, agents=None,
+                     **load_options):
+    agents = agents or load_agents()
+    pools = {agent.name: SFTPSessionPool(size=parse_workers, agent=agent) for agent in agents}
+    try:
+        while True:
+            # No retries here: the next poll is the retry
+            ingest_agents(agents, pools, since=since, parse_workers=parse_workers, follow=True, retries=0,
+                          **load_options)
+            time.sleep(poll_interval)
+    finally:
+        for pool in pools.values():
+            pool.close()
+
+def backfill_paths(source):
+    if os.path.isdir(source):
+        source = os.path.join(source, 'hlrout_*')
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+def parse_backfill_file(path, batch_size=BATCH_SIZE):
+    # Runs in a worker process: returns the file as decoded column batches so only compact lists are pickled back
+    md5 = hashlib.md5()
+    batches = []
+    chunk = []
+    with open(path, 'rb') as f:
+        for raw in f:
+            md5.update(raw)
+            chunk.append(raw)
+            if len(chunk) >= batch_size:
+                batches.append(decode_lines(chunk))
+                chunk = []
+    if chunk:
+        batches.append(decode_lines(chunk))
+    for batch in batches:
+        batch.reconcile()
+    stat = os.stat(path)
+    return FileAttr(os.path.basename(path), stat.st_size, int(stat.st_mtime)), md5.hexdigest(), batches
+
+def backfill(path, processes=BACKFILL_PROCESSES, writers=BACKFILL_WRITERS, batch_size=BATCH_SIZE,
+             load_mode='multirow', source=DEFAULT_SOURCE):
+    conn = get_connection()
     cursor = conn.cursor()
-    
-    os.makedirs('./data', exist_ok=True)
-    
-    ssh = connect_to_server()
-    files = get_hlr_files(ssh)
-    ssh.close()
-    
-    for file in files:
-        with open(f'./data/{file}', 'r') as f:
-            for line in f:
-                if line.strip():
-                    data = json.loads(line.strip())
-                    
-                    bss_data = data['BSS'][0] if data['BSS'] else {}
-                    hlr_data = data['HLR'][0] if data['HLR'] else {}
-                    
-                    cursor.execute("""
-                        INSERT INTO hlr_verification 
-                        (operation, bss_msisdn, bss_imsi, hlr_msisdn, hlr_imsi, file_name)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (
-                        data['operation'],
-                        bss_data.get('msisdn_no', ''),
-                        bss_data.get('imsi_no', ''),
-                        hlr_data.get('msisdn_no', ''),
-                        hlr_data.get('imsi_no', ''),
-                        file
-                    ))
-    
-    conn.commit()
+    manifest = load_manifest(cursor, source)
     cursor.close()
     conn.close()
 
+    # Resumable per file: anything already in the manifest with the same size and mtime is done
+    paths = []
+    for file_path in backfill_paths(path):
+        stat = os.stat(file_path)
+        known = manifest.get(os.path.basename(file_path))
+        if not (known and known[0] == stat.st_size and known[1] == int(stat.st_mtime)):
+            paths.append(file_path)
+    print(f"Backfilling {len(paths)} files from {path} as {source} with {processes} processes and {writers} writers")
+
+    parsed = queue.Queue(maxsize=writers * 2)
+    progress = {'files': 0, 'rows': 0, 'failed': 0}
+    progress_lock = threading.Lock()
+    connect_errors = []
+    started = time.perf_counter()
+
+    def write():
+        try:
+            conn = get_connection(allow_local_infile=(load_mode == 'load-data'))
+        except Exception as e:
+            # As in run_pipeline: fail each parsed file, but keep taking them so collect() never blocks
+            metrics.count('errors', stage='connect', source=source)
+            with progress_lock:
+                connect_errors.append(e)
+            while True:
+                item = parsed.get()
+                if item is None:
+                    return
+                print(f"{item[0].filename}: failed ({e})")
+                with progress_lock:
+                    progress['failed'] += 1
+        cursor = conn.cursor()
+        try:
+            while True:
+                item = parsed.get()
+                if item is None:
+                    return
+                attr, checksum, batches = item
+                try:
+                    sketches, failures, monitored = {}, {}, {}
+                    replaced = False
+                    if attr.filename in manifest:
+                        replaced = delete_file_rows(cursor, attr.filename, source, failures, monitored) > 0
+                    row_count = sum(insert_batch(cursor, batch, attr.filename, load_mode, sketches, source, failures,
+                                                 monitored)
+                                    for batch in batches)
+                    record_manifest(cursor, attr, checksum, row_count, attr.st_size, source)
+                    with metrics.timer('commit', source=source):
+                        log_commit(cursor, attr.filename, source, replaced)
+                        conn.commit()
+                    notify_listeners(monitored, attr.filename, source)
+                    merge_failures(conn, cursor, failures)
+                    merge_sketches(conn, cursor, sketches)
+                except Exception as e:
+                    conn.rollback()
+                    print(f"{attr.filename}: failed ({e})")
+                    with progress_lock:
+                        progress['failed'] += 1
+                    continue
+                metrics.count('rows', row_count, source=source)
+                with progress_lock:
+                    progress['files'] += 1
+                    progress['rows'] += row_count
+                    malformed = sum(batch.malformed for batch in batches)
+                    print(f"[{progress['files']}/{len(paths)}] {attr.filename}: {row_count:,} rows"
+                          f"{f', {malformed:,} malformed' if malformed else ''} | "
+                          f"{progress['rows']:,} total ({rate(progress['rows'], started):,.0f} rows/s)")
+        finally:
+            cursor.close()
+            conn.close()
+
+    def collect(futures):
+        for future in futures:
+            try:
+                parsed.put(future.result())
+            except Exception as e:
+                print(f"Parse failed ({e})")
+                with progress_lock:
+                    progress['failed'] += 1
+
+    writer_threads = [threading.Thread(target=write, daemon=True) for _ in range(writers)]
+    for thread in writer_threads:
+        thread.start()
+    try:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Keep only a couple of files per process in flight so a slow database applies backpressure
+            in_flight = set()
+            for file_path in paths:
+                if len(in_flight) >= processes * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(executor.submit(parse_backfill_file, file_path, batch_size))
+            collect(wait(in_flight)[0])
+    finally:
+        for _ in writer_threads:
+            parsed.put(None)
+        for thread in writer_threads:
+            thread.join()
+    if writer_threads and len(connect_errors) == len(writer_threads):
+        raise connect_errors[0]
+
+    print(f"Backfill finished: {progress['rows']:,} rows from {progress['files']} files "
+          f"({rate(progress['rows'], started):,.0f} rows/s), {progress['failed']} failed")
+    return progress
+
+def rebuild_sketches(since=None):
+    """Recompute the hourly distinct-count sketches from the rows still online, one month at a time."""
+    conn = get_connection()
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(record_timestamp), MAX(record_timestamp) FROM hlr_verification")
+    first, last = cursor.fetchone()
+    if first is None:
+        return 0
+    month = max(first, since or first).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    read_conn = get_connection()
+    read_cursor = read_conn.cursor()
+    merged = 0
+    try:
+        while month <= last:
+            next_month = (month + timedelta(days=32)).replace(day=1)
+            read_cursor.execute(f"""
+                SELECT record_timestamp, operation, {', '.join(SKETCH_COLUMNS)} FROM hlr_verification
+                WHERE record_timestamp >= %s AND record_timestamp < %s
+            """, (month, next_month))
+            sketches = {}
+            while True:
+                rows = read_cursor.fetchmany(BATCH_SIZE)
+                if not rows:
+                    break
+                by_hour = defaultdict(list)
+                for row in rows:
+                    by_hour[row[0].replace(minute=0, second=0, microsecond=0)].append(row[1:])
+                for hour_start, hour_rows in by_hour.items():
+                    operations, *values = zip(*hour_rows)
+                    add_to_sketches(sketches, hour_start, operations, dict(zip(SKETCH_COLUMNS, values)))
+            merge_sketches(conn, cursor, sketches)
+            merged += len(sketches)
+            print(f"{month:%Y-%m}: {len(sketches)} hourly sketches")
+            month = next_month
+    finally:
+        read_cursor.close()
+        read_conn.close()
+        cursor.close()
+        conn.close()
+    return merged
+
+def rebuild_failures():
+    """Recompute the repeat-failure tally from the rows still online, as migrations/0008 first built it.
+
+    merge_failures applies a tally after its rows commit, so a crash in between or a merge that ran out of
+    retries leaves it off. Run this with no loader running:
+    a file committed before the rebuild but merged after it would be counted twice.
+    """
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("DELETE FROM hlr_subscriber_failures")
+        cursor.execute("""
+            INSERT INTO hlr_subscriber_failures (bss_msisdn, recon_status, failure_count, last_file, last_seen)
+            SELECT bss_msisdn, recon_status, COUNT(*), MAX(file_name), MAX(record_timestamp)
+            FROM hlr_verification
+            WHERE recon_status <> %s AND COALESCE(bss_msisdn, '') <> ''
+            GROUP BY bss_msisdn, recon_status
+        """, (RECON_MATCHED,))
+        subscribers = cursor.rowcount
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    print(f"Rebuilt the repeat-failure tally: {subscribers:,} subscriber statuses")
+    return subscribers
+
+def normalize_number(number):
+    number = ''.join(ch for ch in str(number) if ch not in ' +-')
+    if not number.isdigit():
+        raise ValueError(f"Not an MSISDN or IMSI: {number!r}")
+    return number
+
+def search_subscriber(number, prefix=False, limit=SEARCH_LIMIT, cursor=None):
+    """Verification history of an MSISDN or IMSI on either the BSS or the HLR side, newest first.
+
+    With prefix=True, matches every number starting with the given digits instead, on the IMSI columns
+    for a prefix starting with IMSI_HOME and on the MSISDN columns otherwise.
+    """
+    number = normalize_number(number)
+    columns = SUBSCRIBER_COLUMNS
+    if prefix:
+        kind = 'IMSI' if number.startswith(IMSI_HOME) else 'MSISDN'
+        if len(number) < MIN_PREFIX[kind]:
+            # Each branch sorts every row it matches before its LIMIT, so a short prefix sorts most of the table
+            raise ValueError(f"Prefix searches need at least {MIN_PREFIX[kind]} digits for an {kind}")
+        columns = PREFIX_COLUMNS[kind]
+    condition, value = ("LIKE %s", f"{number}%") if prefix else ("= %s", number)
+
+    # One index lookup per column, merged by UNION; an OR across the four columns would not use the indexes
+    branches = [
+        f"(SELECT {', '.join(SEARCH_COLUMNS)} FROM hlr_verification WHERE {column} {condition} "
+        f"ORDER BY record_timestamp DESC, id DESC LIMIT %s)"
+        for column in columns
+    ]
+    query = f"{' UNION '.join(branches)} ORDER BY record_timestamp DESC, id DESC LIMIT %s"
+    params = [value, limit] * len(columns) + [limit]
+
+    own_connection = cursor is None
+    if own_connection:
+        conn = get_connection()
+        cursor = conn.cursor()
+    try:
+        cursor.execute(query, params)
+        return [dict(zip(SEARCH_COLUMNS, row)) for row in cursor.fetchall()]
+    finally:
+        if own_connection:
+            cursor.close()
+            conn.close()
+
+def source_label(source):
+    return '' if source == DEFAULT_SOURCE else f"{source}: "
+
+def rate(rows, started):
+    elapsed = time.perf_counter() - started
+    return rows / elapsed if elapsed > 0 else 0.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Import HLR verification output into MySQL")
+    parser.add_argument('--since', type=datetime.fromisoformat,
+                        help="only ingest files stamped at or after this time, e.g. 2025-07-13 or '2025-07-13 06:00'")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="rows buffered per bulk write (default: %(default)s)")
+    parser.add_argument('--load-mode', choices=LOAD_MODES, default='multirow',
+                        help="multi-row INSERTs, LOAD DATA LOCAL INFILE, or the old one INSERT per row")
+    parser.add_argument('--commit-every', choices=('file', 'batch'), default='file',
+                        help="commit once per file or after every batch")
+    parser.add_argument('--download-workers', type=int, default=DOWNLOAD_WORKERS,
+                        help="parallel SFTP channels fetching files (default: %(default)s)")
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS,
+                        help="parser threads, each with its own DB connection (default: %(default)s)")
+    parser.add_argument('--stream', action='store_true',
+                        help="parse straight from the SFTP handle instead of staging files in ./data")
+    parser.add_argument('--archive', choices=('gzip', 'zstd'),
+                        help="keep a compressed audit copy of each file under ./archive")
+    parser.add_argument('--follow', action='store_true',
+                        help="keep polling and ingest only the bytes appended since each file's checkpoint")
+    parser.add_argument('--poll-interval', type=float, default=FOLLOW_INTERVAL,
+                        help="seconds between polls in --follow mode (default: %(default)s)")
+    parser.add_argument('--agents', default=AGENTS_FILE,
+                        help="JSON list of agents to ingest from concurrently (default: %(default)s, "
+                             "or the single built-in agent if it does not exist)")
+    parser.add_argument('--retries', type=int, default=AGENT_RETRIES,
+                        help="retries per agent after a failed listing or file (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int,
+                        help="serve per-stage timings and counters as Prometheus text on this local port")
+    parser.add_argument('--metrics-log', action='store_true', help="also print them as JSON lines per file")
+    parser.add_argument('--alert-webhook', help="with --metrics-port, also POST live success-rate alerts here")
+
+    commands = parser.add_subparsers(dest='command')
+    backfill_parser = commands.add_parser('backfill', help="load archived hlrout files from a local directory or glob")
+    backfill_parser.add_argument('source', help="directory holding hlrout_* files, or a glob pattern")
+    backfill_parser.add_argument('--processes', type=int, default=BACKFILL_PROCESSES,
+                                 help="parser processes (default: %(default)s)")
+    backfill_parser.add_argument('--writers', type=int, default=BACKFILL_WRITERS,
+                                 help="bulk writer connections (default: %(default)s)")
+    backfill_parser.add_argument('--batch-size', type=int, default=argparse.SUPPRESS,
+                                 help="rows per column batch and bulk write")
+    backfill_parser.add_argument('--load-mode', choices=LOAD_MODES, default=argparse.SUPPRESS)
+    backfill_parser.add_argument('--source-name', default=DEFAULT_SOURCE,
+                                 help="agent name to tag the rows with (default: %(default)s)")
+    sketches_parser = commands.add_parser('sketches', help="rebuild the hourly distinct-count sketches from stored rows")
+    sketches_parser.add_argument('--since', type=datetime.fromisoformat, default=argparse.SUPPRESS,
+                                 help="only rebuild months from this date on")
+    commands.add_parser('failures', help="rebuild the repeat-failure tally from stored rows")
+    search_parser = commands.add_parser('search', help="show the verification history of an MSISDN or IMSI")
+    search_parser.add_argument('number', help="MSISDN or IMSI, on either the BSS or the HLR side")
+    search_parser.add_argument('--prefix', action='store_true', help="match numbers starting with NUMBER")
+    search_parser.add_argument('--limit', type=int, default=SEARCH_LIMIT, help="most rows to show (default: %(default)s)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        # The live success-rate monitor is only worth keeping for a process someone can query
+        monitor = live_monitor.Monitor(webhook=args.alert_webhook)
+        BATCH_LISTENERS.append(monitor.record)
+        metrics.ROUTES['/monitor'] = monitor.route
+        metrics.serve(args.metrics_port)
+    metrics.enable_logging(args.metrics_log)
+
+    if args.command == 'backfill':
+        backfill(args.source, processes=args.processes, writers=args.writers, batch_size=args.batch_size,
+                 load_mode=args.load_mode, source=args.source_name)
+        return
+
+    if args.command == 'sketches':
+        rebuild_sketches(since=args.since)
+        return
+
+    if args.command == 'failures':
+        rebuild_failures()
+        return
+
+    if args.command == 'search':
+        rows = search_subscriber(args.number, prefix=args.prefix, limit=args.limit)
+        writer = csv.writer(sys.stdout)
+        writer.writerow(SEARCH_COLUMNS)
+        writer.writerows(tuple(row.values()) for row in rows)
+        return
+
+    agents = load_agents(args.agents)
+    if args.follow:
+        follow_hlr_files(poll_interval=args.poll_interval, since=args.since, parse_workers=args.parse_workers,
+                         agents=agents, batch_size=args.batch_size, load_mode=args.load_mode)
+        return
+
+    results = ingest_agents(agents, since=args.since, download_workers=args.download_workers,
+                            parse_workers=args.parse_workers, stream=args.stream, retries=args.retries,
+                            archive=args.archive, batch_size=args.batch_size,
+                            load_mode=args.load_mode, commit_every=args.commit_every)
+    files = sum(len(agent_results['loaded']) for agent_results in results.values())
+    print(f"Data imported successfully! {files} new or changed files.")
+
 if __name__ == "__main__":
-    parse_and_insert_data()
-    print("Data imported successfully!")
\ No newline at end of file
+    main()
@@ -1,12 +1,115 @@
 USE HLRDB;
 
+-- Range-partitioned by month so date filters prune to the months they cover;
+-- retention.py keeps future partitions ready and archives/drops expired ones.
 CREATE TABLE hlr_verification (
-    id INT AUTO_INCREMENT PRIMARY KEY,
+    id INT AUTO_INCREMENT,
     operation VARCHAR(50),
     bss_msisdn VARCHAR(20),
     bss_imsi VARCHAR(20),
     hlr_msisdn VARCHAR(50),
     hlr_imsi VARCHAR(50),
+    -- 0 matched, 1 missing in HLR, 2 MSISDN mismatch, 3 IMSI mismatch (hlr_decoder.reconcile)
+    recon_status TINYINT,
+    -- hlr_parser agent the file came from (agents.json name)
+    source VARCHAR(50) NOT NULL DEFAULT 'default',
     file_name VARCHAR(100),
-    record_timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-);
\ No newline at end of file
+    record_timestamp TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, record_timestamp),
+    INDEX idx_timestamp_operation (record_timestamp, operation),
+    INDEX idx_timestamp_id (record_timestamp, id),
+    INDEX idx_file_name (file_name),
+    INDEX idx_bss_msisdn (bss_msisdn),
+    INDEX idx_bss_imsi (bss_imsi),
+    INDEX idx_hlr_msisdn (hlr_msisdn),
+    INDEX idx_hlr_imsi (hlr_imsi)
+)
+PARTITION BY RANGE (UNIX_TIMESTAMP(record_timestamp)) (
+    PARTITION p_start VALUES LESS THAN (UNIX_TIMESTAMP('2025-07-01 00:00:00')),
+    PARTITION p202507 VALUES LESS THAN (UNIX_TIMESTAMP('2025-08-01 00:00:00')),
+    PARTITION p202508 VALUES LESS THAN (UNIX_TIMESTAMP('2025-09-01 00:00:00')),
+    PARTITION p202509 VALUES LESS THAN (UNIX_TIMESTAMP('2025-10-01 00:00:00')),
+    PARTITION p202510 VALUES LESS THAN (UNIX_TIMESTAMP('2025-11-01 00:00:00')),
+    PARTITION p202511 VALUES LESS THAN (UNIX_TIMESTAMP('2025-12-01 00:00:00')),
+    PARTITION p202512 VALUES LESS THAN (UNIX_TIMESTAMP('2026-01-01 00:00:00')),
+    PARTITION p202601 VALUES LESS THAN (UNIX_TIMESTAMP('2026-02-01 00:00:00')),
+    PARTITION p202602 VALUES LESS THAN (UNIX_TIMESTAMP('2026-03-01 00:00:00')),
+    PARTITION p202603 VALUES LESS THAN (UNIX_TIMESTAMP('2026-04-01 00:00:00')),
+    PARTITION p202604 VALUES LESS THAN (UNIX_TIMESTAMP('2026-05-01 00:00:00')),
+    PARTITION p202605 VALUES LESS THAN (UNIX_TIMESTAMP('2026-06-01 00:00:00')),
+    PARTITION p202606 VALUES LESS THAN (UNIX_TIMESTAMP('2026-07-01 00:00:00')),
+    PARTITION p202607 VALUES LESS THAN (UNIX_TIMESTAMP('2026-08-01 00:00:00')),
+    PARTITION p202608 VALUES LESS THAN (UNIX_TIMESTAMP('2026-09-01 00:00:00')),
+    PARTITION p202609 VALUES LESS THAN (UNIX_TIMESTAMP('2026-10-01 00:00:00')),
+    PARTITION p202610 VALUES LESS THAN (UNIX_TIMESTAMP('2026-11-01 00:00:00')),
+    PARTITION p202611 VALUES LESS THAN (UNIX_TIMESTAMP('2026-12-01 00:00:00')),
+    PARTITION p202612 VALUES LESS THAN (UNIX_TIMESTAMP('2027-01-01 00:00:00')),
+    PARTITION pmax VALUES LESS THAN MAXVALUE
+);
+
+CREATE TABLE hlr_ingest_manifest (
+    source VARCHAR(50) NOT NULL DEFAULT 'default',
+    file_name VARCHAR(100) NOT NULL,
+    remote_size BIGINT NOT NULL,
+    remote_mtime BIGINT NOT NULL,
+    checksum CHAR(32),
+    row_count INT NOT NULL DEFAULT 0,
+    committed_offset BIGINT NOT NULL DEFAULT 0,
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (source, file_name)
+);
+
+-- Per-hour counts maintained by hlr_parser in the same transaction as the rows,
+-- so dashboard charts never aggregate hlr_verification itself
+CREATE TABLE hlr_hourly_rollup (
+    hour_start DATETIME NOT NULL,
+    operation VARCHAR(50) NOT NULL,
+    source VARCHAR(50) NOT NULL DEFAULT 'default',
+    file_name VARCHAR(100) NOT NULL,
+    hlr_found TINYINT(1) NOT NULL,
+    recon_status TINYINT NOT NULL DEFAULT 0,
+    record_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_start, operation, source, file_name, hlr_found, recon_status),
+    INDEX idx_rollup_file (file_name)
+);
+
+-- Non-matched verifications per subscriber and reconciliation status across all files,
+-- maintained at ingest so repeat failures are read directly
+CREATE TABLE hlr_subscriber_failures (
+    bss_msisdn VARCHAR(20) NOT NULL,
+    recon_status TINYINT NOT NULL,
+    failure_count INT NOT NULL DEFAULT 0,
+    last_file VARCHAR(100),
+    last_seen TIMESTAMP NULL,
+    PRIMARY KEY (bss_msisdn, recon_status),
+    INDEX idx_failure_count (failure_count)
+);
+-- HyperLogLog registers (hll.py, zlib-compressed) per ingest hour, operation and column,
+-- merged by hlr_parser after each file commits; the Data Quality tab merges them per date range
+CREATE TABLE hlr_hourly_sketch (
+    hour_start DATETIME NOT NULL,
+    operation VARCHAR(50) NOT NULL,
+    column_name VARCHAR(20) NOT NULL,
+    registers BLOB NOT NULL,
+    PRIMARY KEY (hour_start, operation, column_name)
+);
+
+-- Bumped as the last statement of every transaction that changes hlr_verification; the row lock
+-- is held to the commit, so versions follow commit order (db.bump_version)
+CREATE TABLE hlr_ingest_version (
+    id TINYINT NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO hlr_ingest_version (id, version) VALUES (1, 0);
+
+-- Id range each ingest commit wrote for its file, in commit order; data_sync exports by version
+CREATE TABLE hlr_ingest_commits (
+    version BIGINT NOT NULL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL,
+    file_name VARCHAR(100) NOT NULL,
+    first_id INT NULL,
+    last_id INT NULL,
+    replaced BOOLEAN NOT NULL DEFAULT FALSE,
+    committed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_commit_file (source, file_name)
+);
@@ -0,0 +1,178 @@
+import json
+import os
+import threading
+import time
+import urllib.request
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+
+import metrics
+
+# Success-rate counters over sliding windows, fed commit by commit from the ingest stream (hlr_parser's
+# BATCH_LISTENERS). Each window is a ring of fixed-width buckets, so memory is constant per key
+# however many rows go through; source files are the only unbounded key and are capped.
+WINDOWS = (('5m', 300, 30), ('1h', 3600, 60), ('24h', 86400, 96))
+ALERT_WINDOW = '5m'
+BASELINE_WINDOW = '24h'
+MIN_SAMPLES = 100
+MAX_DROP = 0.15
+MAX_FILES = 50
+ALERT_HISTORY = 50
+ALERT_LOG = 'monitor_alerts.log'
+WEBHOOK_TIMEOUT = 5
+MONITOR_URL = os.environ.get('HLR_MONITOR_URL', 'http://127.0.0.1:9108/monitor')
+
+class SlidingWindow:
+    """Total and found counts over the last span seconds, in `buckets` fixed-width slots."""
+
+    def __init__(self, span, buckets):
+        self.width = span / buckets
+        self.epochs = [-1] * buckets
+        self.totals = [0] * buckets
+        self.found = [0] * buckets
+
+    def add(self, now, total, found):
+        epoch = int(now // self.width)
+        slot = epoch % len(self.epochs)
+        if self.epochs[slot] != epoch:
+            # The slot last held a bucket that has since slid out of the window
+            self.epochs[slot] = epoch
+            self.totals[slot] = 0
+            self.found[slot] = 0
+        self.totals[slot] += total
+        self.found[slot] += found
+
+    def counts(self, now):
+        oldest = int(now // self.width) - len(self.epochs) + 1
+        total = found = 0
+        for epoch, slot_total, slot_found in zip(self.epochs, self.totals, self.found):
+            if epoch >= oldest:
+                total += slot_total
+                found += slot_found
+        return total, found
+
+def window_state(total, found):
+    return {'total': total, 'found': found, 'not_found': total - found,
+            'success_rate': found / total if total else None}
+
+class Monitor:
+    """Sliding-window HLR success rates per operation, agent and file, with drop alerts.
+
+    An alert fires when the 5-minute success rate of the whole stream, an operation or an agent falls
+    more than max_drop below its 24-hour rate (or under min_success_rate, if set), and resolves once it
+    recovers to within half that margin. Alerts go to alert_log as JSON lines and, if set, are POSTed
+    to webhook.
+    """
+
+    def __init__(self, max_drop=MAX_DROP, min_success_rate=None, min_samples=MIN_SAMPLES, max_files=MAX_FILES,
+                 alert_log=ALERT_LOG, webhook=None, clock=time.time):
+        self.max_drop = max_drop
+        self.min_success_rate = min_success_rate
+        self.min_samples = min_samples
+        self.max_files = max_files
+        self.alert_log = alert_log
+        self.webhook = webhook
+        self.clock = clock
+        self.alerts = deque(maxlen=ALERT_HISTORY)
+        self._series = {}
+        self._files = OrderedDict()
+        self._alerting = set()
+        self._lock = threading.Lock()
+
+    def _windows(self, key):
+        series = self._files if key.startswith('file:') else self._series
+        windows = series.get(key)
+        if windows is None:
+            windows = series[key] = {name: SlidingWindow(span, buckets) for name, span, buckets in WINDOWS}
+        if series is self._files:
+            # Least recently updated files drop out first
+            self._files.move_to_end(key)
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return windows
+
+    def record(self, counts, file, source):
+        """Count committed rows, given as {(operation, hlr_found): rows}; registered in hlr_parser.BATCH_LISTENERS."""
+        by_operation = Counter()
+        found_by_operation = Counter()
+        for (operation, hlr_found), count in counts.items():
+            by_operation[operation] += count
+            found_by_operation[operation] += count if hlr_found else 0
+        total, found = sum(by_operation.values()), sum(found_by_operation.values())
+        now = self.clock()
+        with self._lock:
+            for key, key_total, key_found in (
+                [('all', total, found), (f"source:{source}", total, found), (f"file:{file}", total, found)]
+                + [(f"operation:{operation}", count, found_by_operation[operation])
+                   for operation, count in by_operation.items()]
+            ):
+                for window in self._windows(key).values():
+                    window.add(now, key_total, key_found)
+            checked = ['all', f"source:{source}"] + [f"operation:{operation}" for operation in by_operation]
+            events = [event for event in (self._check(key, now) for key in checked) if event]
+        for event in events:
+            self._emit(event)
+
+    def _check(self, key, now):
+        # Called with the lock held; returns an alert or resolution event when the key changes state
+        windows = self._series[key]
+        total, found = windows[ALERT_WINDOW].counts(now)
+        if total < self.min_samples:
+            return None
+        rate = found / total
+        baseline_total, baseline_found = windows[BASELINE_WINDOW].counts(now)
+        baseline = baseline_found / baseline_total if baseline_total else rate
+        floor = baseline - self.max_drop
+        if self.min_success_rate is not None:
+            floor = max(floor, self.min_success_rate)
+        event = {'ts': datetime.fromtimestamp(now).isoformat(timespec='seconds'), 'key': key,
+                 'window': ALERT_WINDOW, 'success_rate': round(rate, 4), 'baseline': round(baseline, 4),
+                 'total': total, 'not_found': total - found}
+        if rate < floor and key not in self._alerting:
+            self._alerting.add(key)
+            return {**event, 'status': 'alert'}
+        if rate >= floor + self.max_drop / 2 and key in self._alerting:
+            self._alerting.discard(key)
+            return {**event, 'status': 'resolved'}
+        return None
+
+    def _emit(self, event):
+        self.alerts.append(event)
+        metrics.count('alerts', status=event['status'])
+        print(f"[monitor] {event['status']}: {event['key']} success rate {event['success_rate']:.1%} over "
+              f"{event['window']} ({event['not_found']:,} of {event['total']:,} not found), "
+              f"{BASELINE_WINDOW} rate {event['baseline']:.1%}", flush=True)
+        if self.alert_log:
+            with open(self.alert_log, 'a') as f:
+                f.write(json.dumps(event) + '\n')
+        if self.webhook:
+            threading.Thread(target=self._post, args=(event,), daemon=True).start()
+
+    def _post(self, event):
+        request = urllib.request.Request(self.webhook, data=json.dumps(event).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'})
+        try:
+            urllib.request.urlopen(request, timeout=WEBHOOK_TIMEOUT).close()
+        except Exception as e:
+            print(f"[monitor] webhook failed ({e})", flush=True)
+
+    def state(self):
+        now = self.clock()
+        with self._lock:
+            series = {key: {name: window_state(*window.counts(now)) for name, window in windows.items()}
+                      for key, windows in list(self._series.items()) + list(self._files.items())}
+            alerting = sorted(self._alerting)
+        return {'as_of': datetime.fromtimestamp(now).isoformat(timespec='seconds'),
+                'windows': [name for name, _, _ in WINDOWS], 'series': series, 'alerting': alerting,
+                'alerts': list(self.alerts)}
+
+    def route(self):
+        return json.dumps(self.state()), 'application/json'
+
+def fetch_state(url=MONITOR_URL, timeout=1):
+    """The monitor's state from the process running it, or None if it is not reachable."""
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
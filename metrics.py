@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Process-wide stage timers and counters, shared by ingest, sync, the scheduler and the dashboard.
+# They are read three ways: Prometheus text on /metrics (serve), JSON log lines on stdout
+# (enable_logging), and plain dicts for the dashboard's performance panel (snapshot).
+PREFIX = 'hlr'
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9108
+
+_lock = threading.Lock()
+_timers = {}
+_counters = {}
+_logging = {'enabled': False}
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+def enable_logging(enabled=True):
+    _logging['enabled'] = enabled
+
+def log_event(event, **fields):
+    if _logging['enabled']:
+        print(json.dumps({'ts': datetime.now().isoformat(timespec='milliseconds'), 'event': event, **fields},
+                         default=str), flush=True)
+
+def count(name, value=1, **labels):
+    if not value:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+def observe(stage, seconds, **labels):
+    key = _key(stage, labels)
+    with _lock:
+        timer = _timers.setdefault(key, [0, 0.0, 0.0])
+        timer[0] += 1
+        timer[1] += seconds
+        timer[2] = max(timer[2], seconds)
+
+@contextmanager
+def timer(stage, log=False, **labels):
+    """Time the block as one run of stage; an exception also counts an error for it.
+
+    Labels become Prometheus labels, so keep them low-cardinality (agent, job, query name). The block
+    can add per-run fields (rows, bytes, file) to the yielded dict; they only go to the log line.
+    """
+    fields = {}
+    started = time.perf_counter()
+    try:
+        yield fields
+    except BaseException as e:
+        count('errors', stage=stage, **labels)
+        fields['error'] = repr(e)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        observe(stage, elapsed, **labels)
+        if log:
+            log_event(stage, seconds=round(elapsed, 4), **labels, **fields)
+
+def snapshot():
+    with _lock:
+        timers = [{'stage': stage, 'labels': dict(labels), 'count': n, 'total_s': total, 'mean_ms': total / n * 1000,
+                   'max_ms': longest * 1000}
+                  for (stage, labels), (n, total, longest) in sorted(_timers.items())]
+        counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                    for (name, labels), value in sorted(_counters.items())]
+    return {'timers': timers, 'counters': counters}
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{label}="{value}"' for (label, _), value in zip(labels, escaped)) + '}'
+
+def render():
+    """Everything recorded so far in the Prometheus text exposition format."""
+    state = snapshot()
+    lines = [f"# TYPE {PREFIX}_stage_seconds summary"]
+    for timer in state['timers']:
+        labels = _labels([('stage', timer['stage'])] + sorted(timer['labels'].items()))
+        lines.append(f"{PREFIX}_stage_seconds_count{labels} {timer['count']}")
+        lines.append(f"{PREFIX}_stage_seconds_sum{labels} {timer['total_s']:.6f}")
+    lines.append(f"# TYPE {PREFIX}_stage_seconds_max gauge")
+    for timer in state['timers']:
+        labels = _labels([('stage', timer['stage'])] + sorted(timer['labels'].items()))
+        lines.append(f"{PREFIX}_stage_seconds_max{labels} {timer['max_ms'] / 1000:.6f}")
+    declared = set()
+    for counter in state['counters']:
+        name = f"{PREFIX}_{counter['name']}_total"
+        if name not in declared:
+            lines.append(f"# TYPE {name} counter")
+            declared.add(name)
+        lines.append(f"{name}{_labels(sorted(counter['labels'].items()))} {counter['value']}")
+    return '\n'.join(lines) + '\n'
+
+# Path -> function returning (body, content type); other modules add their own read-only views
+ROUTES = {'/metrics': lambda: (render(), 'text/plain; version=0.0.4; charset=utf-8')}
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        route = ROUTES.get(self.path.split('?')[0])
+        if route is None:
+            self.send_error(404)
+            return
+        body, content_type = route()
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port=METRICS_PORT, host=METRICS_HOST):
+    """Serve ROUTES (/metrics and friends) from a daemon thread; returns the server so callers can shut it down."""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+    return server
@@ -0,0 +1,12 @@
+-- Tracks which hlrout files have already been loaded so hlr_parser only
+-- fetches files that are new or changed on the agent.
+USE HLRDB;
+
+CREATE TABLE IF NOT EXISTS hlr_ingest_manifest (
+    file_name VARCHAR(100) PRIMARY KEY,
+    remote_size BIGINT NOT NULL,
+    remote_mtime BIGINT NOT NULL,
+    checksum CHAR(32),
+    row_count INT NOT NULL DEFAULT 0,
+    ingested_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
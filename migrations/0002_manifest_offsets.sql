@@ -0,0 +1,8 @@
+-- Byte offset checkpoint per file for hlr_parser --follow. Files already in the
+-- manifest were loaded in full, so their checkpoint starts at the end.
+USE HLRDB;
+
+ALTER TABLE hlr_ingest_manifest
+    ADD COLUMN committed_offset BIGINT NOT NULL DEFAULT 0 AFTER row_count;
+
+UPDATE hlr_ingest_manifest SET committed_offset = remote_size;
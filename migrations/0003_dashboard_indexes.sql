@@ -0,0 +1,7 @@
+-- Lets app.get_data's half-open record_timestamp ranges, operation filter and
+-- file filter (and hlr_parser's per-file deletes) use indexes instead of full scans.
+USE HLRDB;
+
+ALTER TABLE hlr_verification
+    ADD INDEX idx_timestamp_operation (record_timestamp, operation),
+    ADD INDEX idx_file_name (file_name);
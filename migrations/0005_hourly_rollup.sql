@@ -0,0 +1,24 @@
+-- Hourly rollup read by the dashboard charts, seeded from the rows already loaded.
+-- hlr_parser keeps it current from here on.
+USE HLRDB;
+
+CREATE TABLE IF NOT EXISTS hlr_hourly_rollup (
+    hour_start DATETIME NOT NULL,
+    operation VARCHAR(50) NOT NULL,
+    file_name VARCHAR(100) NOT NULL,
+    hlr_found TINYINT(1) NOT NULL,
+    record_count INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (hour_start, operation, file_name, hlr_found),
+    INDEX idx_rollup_file (file_name)
+);
+
+INSERT INTO hlr_hourly_rollup (hour_start, operation, file_name, hlr_found, record_count)
+SELECT
+    DATE_FORMAT(record_timestamp, '%Y-%m-%d %H:00:00'),
+    COALESCE(operation, ''),
+    COALESCE(file_name, ''),
+    COALESCE(hlr_msisdn, '') <> '' AND hlr_msisdn NOT LIKE '%NO DATA FOUND%',
+    COUNT(*)
+FROM hlr_verification
+GROUP BY 1, 2, 3, 4
+ON DUPLICATE KEY UPDATE record_count = VALUES(record_count);
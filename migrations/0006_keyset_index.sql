@@ -0,0 +1,6 @@
+-- Index order matching the Recent Records keyset, (record_timestamp, id) newest first,
+-- so each page is a bounded index range read instead of a filesort over the filter.
+USE HLRDB;
+
+ALTER TABLE hlr_verification
+    ADD INDEX idx_timestamp_id (record_timestamp, id);
@@ -0,0 +1,9 @@
+-- Subscriber search (hlr_parser.search_subscriber) looks each number up on all four
+-- MSISDN/IMSI columns; exact and prefix (LIKE 'digits%') matches are index range reads.
+USE HLRDB;
+
+ALTER TABLE hlr_verification
+    ADD INDEX idx_bss_msisdn (bss_msisdn),
+    ADD INDEX idx_bss_imsi (bss_imsi),
+    ADD INDEX idx_hlr_msisdn (hlr_msisdn),
+    ADD INDEX idx_hlr_imsi (hlr_imsi);
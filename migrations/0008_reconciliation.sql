@@ -0,0 +1,52 @@
+-- BSS vs HLR reconciliation: a per-row recon_status, carried into the hourly rollup,
+-- and a per-subscriber failure tally. Existing rows are classified with the same rules
+-- as hlr_decoder.reconcile; rollup hours of already archived partitions can only tell
+-- missing from found, so their found rows stay counted as matched.
+USE HLRDB;
+
+ALTER TABLE hlr_verification
+    ADD COLUMN recon_status TINYINT AFTER hlr_imsi;
+
+UPDATE hlr_verification SET recon_status = CASE
+    WHEN COALESCE(hlr_msisdn, '') = '' OR hlr_msisdn LIKE '%NO DATA FOUND%' THEN 1
+    WHEN NOT (bss_imsi <=> hlr_imsi) THEN 3
+    WHEN (bss_msisdn <=> hlr_msisdn) = (operation <=> 'CHANGEMSISDN') THEN 2
+    ELSE 0
+END;
+
+ALTER TABLE hlr_hourly_rollup
+    ADD COLUMN recon_status TINYINT NOT NULL DEFAULT 0 AFTER hlr_found,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (hour_start, operation, file_name, hlr_found, recon_status);
+
+UPDATE hlr_hourly_rollup SET recon_status = 1 WHERE hlr_found = 0;
+
+DELETE FROM hlr_hourly_rollup
+WHERE file_name IN (SELECT file_name FROM (SELECT DISTINCT COALESCE(file_name, '') AS file_name FROM hlr_verification) live);
+
+INSERT INTO hlr_hourly_rollup (hour_start, operation, file_name, hlr_found, recon_status, record_count)
+SELECT
+    DATE_FORMAT(record_timestamp, '%Y-%m-%d %H:00:00'),
+    COALESCE(operation, ''),
+    COALESCE(file_name, ''),
+    recon_status <> 1,
+    recon_status,
+    COUNT(*)
+FROM hlr_verification
+GROUP BY 1, 2, 3, 4, 5;
+
+CREATE TABLE IF NOT EXISTS hlr_subscriber_failures (
+    bss_msisdn VARCHAR(20) NOT NULL,
+    recon_status TINYINT NOT NULL,
+    failure_count INT NOT NULL DEFAULT 0,
+    last_file VARCHAR(100),
+    last_seen TIMESTAMP NULL,
+    PRIMARY KEY (bss_msisdn, recon_status),
+    INDEX idx_failure_count (failure_count)
+);
+
+INSERT INTO hlr_subscriber_failures (bss_msisdn, recon_status, failure_count, last_file, last_seen)
+SELECT bss_msisdn, recon_status, COUNT(*), MAX(file_name), MAX(record_timestamp)
+FROM hlr_verification
+WHERE recon_status <> 0 AND COALESCE(bss_msisdn, '') <> ''
+GROUP BY bss_msisdn, recon_status;
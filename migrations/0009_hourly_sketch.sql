@@ -0,0 +1,11 @@
+-- Hourly distinct-count sketches for the Data Quality tab. hlr_parser maintains them from
+-- here on; fill in the rows already loaded with `python hlr_parser.py sketches`.
+USE HLRDB;
+
+CREATE TABLE IF NOT EXISTS hlr_hourly_sketch (
+    hour_start DATETIME NOT NULL,
+    operation VARCHAR(50) NOT NULL,
+    column_name VARCHAR(20) NOT NULL,
+    registers BLOB NOT NULL,
+    PRIMARY KEY (hour_start, operation, column_name)
+);
@@ -0,0 +1,17 @@
+-- Multi-agent ingestion: rows, manifest entries and rollup counts carry the agent they came
+-- from, since each region's verify job writes the same hlrout_* file names. Everything
+-- loaded so far came from the single built-in agent, named 'default' in hlr_parser.
+USE HLRDB;
+
+ALTER TABLE hlr_verification
+    ADD COLUMN source VARCHAR(50) NOT NULL DEFAULT 'default' AFTER recon_status;
+
+ALTER TABLE hlr_ingest_manifest
+    ADD COLUMN source VARCHAR(50) NOT NULL DEFAULT 'default' FIRST,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (source, file_name);
+
+ALTER TABLE hlr_hourly_rollup
+    ADD COLUMN source VARCHAR(50) NOT NULL DEFAULT 'default' AFTER operation,
+    DROP PRIMARY KEY,
+    ADD PRIMARY KEY (hour_start, operation, source, file_name, hlr_found, recon_status);
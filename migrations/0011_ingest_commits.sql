@@ -0,0 +1,21 @@
+-- Commit-ordered ingest log. Parallel loaders commit whole files out of id order, so an
+-- `id > watermark` export can step past rows that commit later. Each ingest transaction now
+-- bumps hlr_ingest_version last and records the id range it wrote; data_sync exports by
+-- version instead. A snapshot made before this catches up by id once, then follows the log.
+USE HLRDB;
+
+CREATE TABLE IF NOT EXISTS hlr_ingest_version (
+    id TINYINT NOT NULL PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT IGNORE INTO hlr_ingest_version (id, version) VALUES (1, 0);
+
+CREATE TABLE IF NOT EXISTS hlr_ingest_commits (
+    version BIGINT NOT NULL PRIMARY KEY,
+    source VARCHAR(50) NOT NULL,
+    file_name VARCHAR(100) NOT NULL,
+    first_id INT NOT NULL,
+    last_id INT NOT NULL,
+    committed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    INDEX idx_commit_file (source, file_name)
+);
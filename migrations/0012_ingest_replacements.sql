@@ -0,0 +1,10 @@
+-- Reloads in the commit log. A changed file, a per-batch load, a truncated followed file and a re-run
+-- backfill all delete the file's rows before inserting it again; the commit that does so is flagged
+-- replaced, so data_sync drops the file's earlier records from the snapshot before appending the new ones.
+-- A replacing commit that inserts nothing has no id range.
+USE HLRDB;
+
+ALTER TABLE hlr_ingest_commits
+    ADD COLUMN replaced BOOLEAN NOT NULL DEFAULT FALSE AFTER last_id,
+    MODIFY first_id INT NULL,
+    MODIFY last_id INT NULL;
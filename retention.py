@@ -0,0 +1,161 @@
+import argparse
+import csv
+import gzip
+import os
+from datetime import date, datetime
+
+from db import bump_version, get_connection
+
+ARCHIVE_PATH = './archive/partitions'
+KEEP_MONTHS = 6
+MONTHS_AHEAD = 2
+EXPORT_CHUNK = 10000
+EXPORT_COLUMNS = ['id', 'operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi', 'recon_status', 'source',
+                  'file_name', 'record_timestamp']
+
+def add_months(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(month_start):
+    return f"p{month_start:%Y%m}"
+
+def list_partitions(cursor):
+    # Monthly partitions in order, with the first day of the month after each one's range (None for pmax)
+    cursor.execute("""
+        SELECT PARTITION_NAME, PARTITION_DESCRIPTION, TABLE_ROWS
+        FROM information_schema.PARTITIONS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'hlr_verification'
+        ORDER BY PARTITION_ORDINAL_POSITION
+    """)
+    partitions = []
+    for name, description, table_rows in cursor.fetchall():
+        upper = None if description == 'MAXVALUE' else datetime.fromtimestamp(int(description)).date()
+        partitions.append((name, upper, table_rows))
+    return partitions
+
+def ensure_partitions(cursor, months_ahead=MONTHS_AHEAD):
+    # Split pmax so there is always a dedicated partition for the next few months
+    partitions = list_partitions(cursor)
+    bounded = [upper for _, upper, _ in partitions if upper]
+    last_upper = max(bounded) if bounded else date.today().replace(day=1)
+    target = add_months(date.today().replace(day=1), months_ahead + 1)
+
+    new_partitions = []
+    while last_upper < target:
+        upper = add_months(last_upper, 1)
+        new_partitions.append(
+            f"PARTITION {partition_name(last_upper)} VALUES LESS THAN (UNIX_TIMESTAMP('{upper:%Y-%m-%d} 00:00:00'))"
+        )
+        last_upper = upper
+    if not new_partitions:
+        return []
+
+    cursor.execute(f"""
+        ALTER TABLE hlr_verification REORGANIZE PARTITION pmax INTO (
+            {', '.join(new_partitions)},
+            PARTITION pmax VALUES LESS THAN MAXVALUE
+        )
+    """)
+    return new_partitions
+
+def export_partition(conn, name):
+    os.makedirs(ARCHIVE_PATH, exist_ok=True)
+    path = f"{ARCHIVE_PATH}/hlr_verification_{name}.csv.gz"
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT {', '.join(EXPORT_COLUMNS)} FROM hlr_verification PARTITION ({name}) ORDER BY id")
+    row_count = 0
+    with gzip.open(f"{path}.part", 'wt', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_COLUMNS)
+        while True:
+            rows = cursor.fetchmany(EXPORT_CHUNK)
+            if not rows:
+                break
+            writer.writerows(rows)
+            row_count += len(rows)
+    cursor.close()
+    os.replace(f"{path}.part", path)
+    return path, row_count
+
+def apply_retention(keep_months=KEEP_MONTHS, months_ahead=MONTHS_AHEAD, dry_run=False):
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    if not dry_run:
+        for partition in ensure_partitions(cursor, months_ahead):
+            print(f"Added {partition}")
+
+    cutoff = add_months(date.today().replace(day=1), -keep_months)
+    archived = []
+    for name, upper, _ in list_partitions(cursor):
+        if upper is None or upper > cutoff:
+            continue
+        if dry_run:
+            print(f"Would archive and drop {name} (before {upper})")
+            continue
+        path, row_count = export_partition(conn, name)
+        cursor.execute(f"SELECT COUNT(*) FROM hlr_verification PARTITION ({name})")
+        if cursor.fetchone()[0] != row_count:
+            print(f"{name}: row count changed during export, keeping partition")
+            continue
+        cursor.execute(f"ALTER TABLE hlr_verification DROP PARTITION {name}")
+        bump_version(cursor)
+        conn.commit()
+        print(f"Archived {row_count:,} rows from {name} to {path} and dropped it")
+        archived.append(path)
+
+    if not dry_run:
+        # data_sync only reads commits newer than its snapshot, so expired months' entries can go too
+        cursor.execute("DELETE FROM hlr_ingest_commits WHERE committed_at < %s", (cutoff,))
+        conn.commit()
+
+    cursor.close()
+    conn.close()
+    return archived
+
+def restore_archive(path, batch_size=EXPORT_CHUNK):
+    # Rows keep their original id and record_timestamp; with the month's partition gone they
+    # land in the oldest remaining partition whose range covers them
+    conn = get_connection()
+    cursor = conn.cursor()
+    row_count = 0
+    with gzip.open(path, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        # Archives written before a column was added restore with that column's default
+        columns = next(reader)
+        placeholders = ', '.join(['%s'] * len(columns))
+        batch = []
+        for row in reader:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                cursor.executemany(f"INSERT IGNORE INTO hlr_verification ({', '.join(columns)}) VALUES ({placeholders})", batch)
+                row_count += len(batch)
+                batch = []
+        if batch:
+            cursor.executemany(f"INSERT IGNORE INTO hlr_verification ({', '.join(columns)}) VALUES ({placeholders})", batch)
+            row_count += len(batch)
+    bump_version(cursor)
+    conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"Restored {row_count:,} rows from {path}")
+    return row_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain monthly partitions of hlr_verification and archive expired ones")
+    parser.add_argument('--keep-months', type=int, default=KEEP_MONTHS,
+                        help="months of data to keep online, not counting the current one (default: %(default)s)")
+    parser.add_argument('--months-ahead', type=int, default=MONTHS_AHEAD,
+                        help="future monthly partitions to keep ready (default: %(default)s)")
+    parser.add_argument('--dry-run', action='store_true', help="only report what would be archived")
+    parser.add_argument('--restore', metavar='ARCHIVE', help="load a previously archived partition back")
+    args = parser.parse_args()
+
+    if args.restore:
+        restore_archive(args.restore)
+    else:
+        apply_retention(args.keep_months, args.months_ahead, args.dry_run)
+
+if __name__ == "__main__":
+    main()
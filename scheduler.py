@@ -1,42 +1,218 @@
+import argparse
+import random
+import threading
 import time
-import mysql.connector
-import subprocess
+import traceback
+from contextlib import contextmanager
 from datetime import datetime
 
-def get_latest_record_count():
+import data_sync
+import hlr_parser
+import live_monitor
+import metrics
+import snapshot
+from db import get_connection, get_version
+
+INGEST_INTERVAL = 60
+SYNC_INTERVAL = 10
+JITTER = 0.1
+MAX_BACKOFF = 900
+
+def log(message):
+    print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+def get_watermark():
+    # The ingest version moves on every commit, in commit order, unlike MAX(id) (see data_sync.export_new_rows)
+    conn = get_connection()
     try:
-        conn = mysql.connector.connect(
-            host='mysql',
-            user='hlruser',
-            password='hlrpass',
-            database='HLRDB'
-        )
         cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM hlr_verification")
-        count = cursor.fetchone()[0]
+        watermark = get_version(cursor)
+        cursor.close()
+        return watermark
+    finally:
+        conn.close()
+
+@contextmanager
+def named_lock(name):
+    # MySQL named lock held for the duration of a job, so a second scheduler (or container) skips the
+    # tick instead of running the same job alongside this one
+    conn = get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT GET_LOCK(%s, 0)", (name,))
+        acquired = cursor.fetchone()[0] == 1
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+                cursor.fetchone()
+    finally:
+        cursor.close()
         conn.close()
-        return count
-    except:
-        return 0
-
-def run_data_sync():
-    print(f"New records detected at {datetime.now()}")
-    subprocess.run(['python', 'data_sync.py'])
-
-def monitor_and_sync():
-    last_count = get_latest_record_count()
-    print(f"Starting monitor. Current records: {last_count}")
-    
-    while True:
-        time.sleep(300)  # Check every 5 minutes
-        current_count = get_latest_record_count()
-        
-        if current_count > last_count:
-            print(f"Records increased: {last_count} -> {current_count}")
-            run_data_sync()
-            last_count = current_count
-        else:
-            print(f"No new records. Count: {current_count}")
+
+class Job:
+    """Runs fn every interval seconds (with jitter) on its own thread, backing off after failures."""
+
+    def __init__(self, name, fn, interval, jitter=JITTER, max_backoff=MAX_BACKOFF):
+        self.name = name
+        self.fn = fn
+        self.interval = interval
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self.failures = 0
+        self.wake = threading.Event()
+        self._running = threading.Lock()
+
+    def next_delay(self):
+        delay = self.interval
+        if self.failures:
+            delay = min(self.interval * 2 ** self.failures, max(self.max_backoff, self.interval))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def run_once(self):
+        if not self._running.acquire(blocking=False):
+            log(f"{self.name}: previous run still in progress, skipping")
+            return
+        try:
+            with named_lock(f"hlr_scheduler_{self.name}") as acquired:
+                if not acquired:
+                    log(f"{self.name}: running in another scheduler, skipping")
+                    return
+                with metrics.timer('job', log=True, job=self.name):
+                    self.fn()
+            self.failures = 0
+        except Exception:
+            self.failures += 1
+            log(f"{self.name}: failed ({self.failures} in a row), retrying in up to "
+                f"{self.next_delay() / (1 - self.jitter):.0f}s")
+            traceback.print_exc()
+        finally:
+            self._running.release()
+
+    def loop(self, stop):
+        while not stop.is_set():
+            self.run_once()
+            # trigger() cuts the wait short, so new work is picked up without waiting out the interval
+            self.wake.wait(self.next_delay())
+            self.wake.clear()
+
+    def trigger(self):
+        self.wake.set()
+
+class Scheduler:
+    def __init__(self, ingest_interval=INGEST_INTERVAL, sync_interval=SYNC_INTERVAL, jitter=JITTER,
+                 max_backoff=MAX_BACKOFF, ingest=True, parse_workers=hlr_parser.PARSE_WORKERS, follow=False,
+                 agents=None, monitor=None, **load_options):
+        self.parse_workers = parse_workers
+        self.follow = follow
+        self.load_options = load_options
+        self.agents = agents or hlr_parser.load_agents()
+        self.pools = {agent.name: hlr_parser.SFTPSessionPool(size=parse_workers, agent=agent)
+                      for agent in self.agents} if ingest else {}
+        # Every batch this process ingests also feeds the live monitor, served at /monitor
+        self.monitor = monitor or live_monitor.Monitor()
+        if ingest:
+            hlr_parser.BATCH_LISTENERS.append(self.monitor.record)
+        metrics.ROUTES['/monitor'] = self.monitor.route
+        self.synced_watermark = None
+        self.stop = threading.Event()
+        self.sync_job = Job('sync', self.sync, sync_interval, jitter, max_backoff)
+        self.jobs = [self.sync_job]
+        if ingest:
+            self.jobs.append(Job('ingest', self.ingest, ingest_interval, jitter, max_backoff))
+
+    def ingest(self):
+        # Streams straight from every agent at once, each over the scheduler's long-lived SFTP pool for it;
+        # an agent that stays down is reported here but does not fail the job for the others. No retries
+        # within a tick: the next tick retries, instead of sleeping while the healthy agents wait
+        results = hlr_parser.ingest_agents(self.agents, self.pools, parse_workers=self.parse_workers, stream=True,
+                                           follow=self.follow, retries=0, **self.load_options)
+        for name, agent_results in results.items():
+            if agent_results['error']:
+                log(f"ingest: agent {name} unreachable ({agent_results['error']})")
+        loaded = sum(len(agent_results['loaded']) for agent_results in results.values())
+        if loaded:
+            log(f"ingest: loaded {loaded} files")
+            self.sync_job.trigger()
+        if all(agent_results['error'] for agent_results in results.values()):
+            # Nothing reachable at all: fail the job so its backoff spaces out the next attempts
+            raise RuntimeError("ingest: no agent reachable")
+
+    def sync(self):
+        watermark = get_watermark()
+        if self.synced_watermark is None:
+            # Resume from the snapshot's own watermark, so rows that arrived while we were down still go out
+            self.synced_watermark = snapshot.load_manifest().get('version') or 0
+            log(f"sync: snapshot is at version {self.synced_watermark}, database at {watermark}")
+        if watermark <= self.synced_watermark:
+            return
+        log(f"sync: new records {self.synced_watermark} -> {watermark}")
+        data_sync.fetch_and_push_data()
+        self.synced_watermark = watermark
+
+    def run(self):
+        threads = [threading.Thread(target=job.loop, args=(self.stop,), name=job.name, daemon=True)
+                   for job in self.jobs]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                time.sleep(1)
+        except KeyboardInterrupt:
+            log("Stopping scheduler")
+            self.stop.set()
+            for job in self.jobs:
+                job.trigger()
+            for thread in threads:
+                thread.join()
+        finally:
+            for pool in self.pools.values():
+                pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new HLR files and sync new records to the cloud dashboard")
+    parser.add_argument('--ingest-interval', type=float, default=INGEST_INTERVAL,
+                        help="seconds between ingest runs (default: %(default)s)")
+    parser.add_argument('--sync-interval', type=float, default=SYNC_INTERVAL,
+                        help="seconds between watermark checks (default: %(default)s)")
+    parser.add_argument('--jitter', type=float, default=JITTER,
+                        help="random +/- fraction applied to every interval (default: %(default)s)")
+    parser.add_argument('--max-backoff', type=float, default=MAX_BACKOFF,
+                        help="longest wait after repeated failures, in seconds (default: %(default)s)")
+    parser.add_argument('--no-ingest', action='store_true', help="only sync; leave ingestion to hlr_parser.py")
+    parser.add_argument('--parse-workers', type=int, default=hlr_parser.PARSE_WORKERS,
+                        help="files loaded in parallel per ingest run (default: %(default)s)")
+    parser.add_argument('--follow', action='store_true', help="also load lines appended to files already loaded")
+    parser.add_argument('--load-mode', choices=hlr_parser.LOAD_MODES, default='multirow',
+                        help="how rows are sent to MySQL (default: %(default)s)")
+    parser.add_argument('--agents', default=hlr_parser.AGENTS_FILE,
+                        help="JSON list of agents to ingest from (default: %(default)s)")
+    parser.add_argument('--metrics-port', type=int, default=metrics.METRICS_PORT,
+                        help="local port serving Prometheus-text metrics, 0 to disable (default: %(default)s)")
+    parser.add_argument('--metrics-host', default=metrics.METRICS_HOST,
+                        help="address the metrics and /monitor endpoints listen on (default: %(default)s)")
+    parser.add_argument('--metrics-log', action='store_true', help="print per-stage timings as JSON lines")
+    parser.add_argument('--max-drop', type=float, default=live_monitor.MAX_DROP,
+                        help="alert when the 5-minute success rate falls this far below the 24-hour rate "
+                             "(default: %(default)s)")
+    parser.add_argument('--min-success-rate', type=float,
+                        help="also alert whenever the 5-minute success rate is below this")
+    parser.add_argument('--alert-log', default=live_monitor.ALERT_LOG,
+                        help="file alerts are appended to as JSON lines (default: %(default)s)")
+    parser.add_argument('--alert-webhook', help="URL alerts are POSTed to as JSON")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        metrics.serve(args.metrics_port, args.metrics_host)
+    metrics.enable_logging(args.metrics_log)
+    monitor = live_monitor.Monitor(max_drop=args.max_drop, min_success_rate=args.min_success_rate,
+                                   alert_log=args.alert_log, webhook=args.alert_webhook)
+
+    log(f"Starting scheduler (ingest every {args.ingest_interval:g}s, sync check every {args.sync_interval:g}s)")
+    Scheduler(args.ingest_interval, args.sync_interval, args.jitter, args.max_backoff, ingest=not args.no_ingest,
+              parse_workers=args.parse_workers, follow=args.follow, agents=hlr_parser.load_agents(args.agents),
+              monitor=monitor, load_mode=args.load_mode).run()
 
 if __name__ == "__main__":
-    monitor_and_sync()
\ No newline at end of file
+    main()
@@ -0,0 +1,193 @@
+import gzip
+import json
+import os
+from collections import defaultdict
+from datetime import date
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from hlr_frame import count_frame, frame_from_table, to_compact_frame
+
+# The cloud snapshot is a directory of uncompressed Arrow IPC segments, one or more per record date, plus a
+# small manifest with the last exported ingest version and each segment's per-file, per-operation counts.
+# The dashboard memory-maps segments as committed, with nothing to parse. New rows only ever add a segment,
+# so each sync commits a file the size of the new data; closed days are compacted into a single segment.
+SNAPSHOT_PATH = 'snapshot'
+MANIFEST_NAME = 'manifest.json'
+SNAPSHOT_COLUMNS = ('id', 'operation', 'bss_msisdn', 'bss_imsi', 'hlr_msisdn', 'hlr_imsi', 'source', 'file_name',
+                    'record_timestamp')
+DICTIONARY_COLUMNS = ('operation', 'source', 'file_name')
+# Segments written before records kept their agent have no source; a reload of the original agent's file drops them
+LEGACY_SOURCE = 'default'
+COMPACT_AFTER = 24
+# Snapshots written before segments were Arrow hold gzip NDJSON ones until compaction rewrites them;
+# each is converted once to a local, gitignored Arrow IPC copy here
+LEGACY_SUFFIX = '.ndjson.gz'
+ARROW_CACHE = '.arrow'
+
+def load_manifest(root=SNAPSHOT_PATH):
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'version': None, 'segments': []}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, root=SNAPSHOT_PATH):
+    path = os.path.join(root, MANIFEST_NAME)
+    with open(f"{path}.part", 'w') as f:
+        json.dump(manifest, f, indent=1)
+        f.write('\n')
+    os.replace(f"{path}.part", path)
+    return path
+
+def records_table(records):
+    """Snapshot records (dicts) as an Arrow table of the dashboard's compact frame."""
+    frame = to_compact_frame(records)
+    frame['record_timestamp'] = pd.to_datetime(frame['record_timestamp'])
+    table = pa.Table.from_pandas(frame, preserve_index=False).replace_schema_metadata(None)
+    # Fixed dictionary index width, so segments with few or many distinct values share one schema
+    for column in DICTIONARY_COLUMNS:
+        index = table.schema.get_field_index(column)
+        if index >= 0:
+            table = table.set_column(index, column, table[column].cast(pa.dictionary(pa.int32(), pa.string())))
+    return table
+
+def write_table(table, path):
+    # One shared dictionary per column: the IPC file format cannot replace a dictionary between batches
+    table = table.unify_dictionaries().combine_chunks()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with pa.OSFile(f"{path}.part", 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(f"{path}.part", path)
+
+def write_segment(table, day, root=SNAPSHOT_PATH):
+    # table is in id order; the same rows always give the same bytes (and so the same git blob)
+    min_id, max_id = table['id'][0].as_py(), table['id'][-1].as_py()
+    relative = f"{day}/{min_id:012d}-{max_id:012d}.arrow"
+    write_table(table, os.path.join(root, relative))
+    return {'path': relative, 'day': day, 'rows': table.num_rows, 'min_id': min_id, 'max_id': max_id,
+            'counts': segment_counts(table)}
+
+def segment_counts(table):
+    # [file_name, operation, hlr_found, count] rows, as load_counts sums them
+    counts = count_frame(frame_from_table(table.select(['file_name', 'operation', 'hlr_found'])))
+    return [[file_name, operation, bool(found), int(count)]
+            for file_name, operation, found, count in counts.itertuples(index=False, name=None)]
+
+def read_segment(relative, root=SNAPSHOT_PATH):
+    with gzip.open(os.path.join(root, relative), 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def append_rows(manifest, rows, root=SNAPSHOT_PATH):
+    """Write rows (tuples in SNAPSHOT_COLUMNS order, ascending id) as new segments, one per record date."""
+    by_day = defaultdict(list)
+    for row in rows:
+        record = dict(zip(SNAPSHOT_COLUMNS, row))
+        by_day[str(record['record_timestamp'])[:10]].append(record)
+
+    added = [write_segment(records_table(records), day, root) for day, records in sorted(by_day.items())]
+    manifest['segments'].extend(added)
+    return [segment['path'] for segment in added]
+
+def compact(manifest, root=SNAPSHOT_PATH, compact_after=COMPACT_AFTER, today=None):
+    # Days before today are merged into one segment as soon as they have more than one; today's
+    # segments only once there are more than compact_after of them. Legacy NDJSON segments are
+    # rewritten as Arrow even when they are a day's only one.
+    today = str(today or date.today())
+    by_day = defaultdict(list)
+    for segment in manifest['segments']:
+        by_day[segment['day']].append(segment)
+
+    added, removed = [], []
+    for day, segments in sorted(by_day.items()):
+        legacy = any(segment['path'].endswith(LEGACY_SUFFIX) for segment in segments)
+        if not legacy and (len(segments) < 2 or (day >= today and len(segments) <= compact_after)):
+            continue
+        table = pa.concat_tables([segment_table(segment['path'], root) for segment in segments],
+                                 promote_options='default')
+        merged = write_segment(table.take(pc.sort_indices(table['id'])), day, root)
+        for segment in segments:
+            manifest['segments'].remove(segment)
+            if segment['path'] != merged['path']:
+                os.remove(os.path.join(root, segment['path']))
+                removed.append(segment['path'])
+        manifest['segments'].append(merged)
+        added.append(merged['path'])
+    manifest['segments'].sort(key=lambda segment: segment['min_id'])
+    return added, removed
+
+def drop_file(manifest, source, file_name, root=SNAPSHOT_PATH):
+    """Rewrite the segments holding a file's records without them; returns (added paths, removed paths)."""
+    added, removed = [], []
+    for segment in list(manifest['segments']):
+        if 'counts' in segment and not any(row[0] == file_name for row in segment['counts']):
+            continue
+        table = segment_table(segment['path'], root)
+        if 'source' in table.column_names:
+            same_source = pc.equal(table['source'], source)
+            if source == LEGACY_SOURCE:
+                same_source = pc.or_kleene(same_source, pc.is_null(table['source']))
+        else:
+            same_source = pa.scalar(source == LEGACY_SOURCE)
+        dropped = pc.fill_null(pc.and_kleene(pc.equal(table['file_name'], file_name), same_source), False)
+        if not pc.any(dropped).as_py():
+            continue
+        kept = table.filter(pc.invert(dropped))
+        manifest['segments'].remove(segment)
+        rewritten = write_segment(kept, segment['day'], root) if kept.num_rows else None
+        if rewritten:
+            manifest['segments'].append(rewritten)
+            added.append(rewritten['path'])
+        if not rewritten or rewritten['path'] != segment['path']:
+            os.remove(os.path.join(root, segment['path']))
+            removed.append(segment['path'])
+    manifest['segments'].sort(key=lambda segment: segment['min_id'])
+    return added, removed
+
+def manifest_signature(root=SNAPSHOT_PATH):
+    # Changes whenever a sync rewrites the manifest; used as the dashboard's cache key
+    try:
+        stat = os.stat(os.path.join(root, MANIFEST_NAME))
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+def arrow_cache_name(relative):
+    return relative.replace('/', '_').replace(LEGACY_SUFFIX, '.arrow')
+
+def segment_table(relative, root=SNAPSHOT_PATH):
+    """The segment as an Arrow table memory-mapped from its IPC file (for a legacy segment, its converted copy)."""
+    path = os.path.join(root, relative)
+    if relative.endswith(LEGACY_SUFFIX):
+        path = os.path.join(root, ARROW_CACHE, arrow_cache_name(relative))
+        if not os.path.exists(path):
+            write_table(records_table(read_segment(relative, root)), path)
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).read_all()
+
+def load_table(root=SNAPSHOT_PATH):
+    """All segments as one Arrow table, dropping cached conversions of segments that were compacted away."""
+    manifest = load_manifest(root)
+    tables = [segment_table(segment['path'], root) for segment in manifest['segments']]
+    live = {arrow_cache_name(segment['path']) for segment in manifest['segments']}
+    cache_dir = os.path.join(root, ARROW_CACHE)
+    if os.path.isdir(cache_dir):
+        for name in os.listdir(cache_dir):
+            if name not in live:
+                os.remove(os.path.join(cache_dir, name))
+    return pa.concat_tables(tables, promote_options='default') if tables else None
+
+def load_counts(root=SNAPSHOT_PATH):
+    """Record counts per file, operation and hlr_found from the manifest, without reading any rows."""
+    rows = []
+    for segment in load_manifest(root)['segments']:
+        if 'counts' in segment:
+            rows.extend(segment['counts'])
+        else:
+            # Written before segments carried their counts; compaction adds them
+            rows.extend(segment_counts(segment_table(segment['path'], root)))
+    counts = pd.DataFrame(rows, columns=['file_name', 'operation', 'hlr_found', 'count'])
+    counts = counts.groupby(['file_name', 'operation', 'hlr_found'], observed=True)['count'].sum().reset_index()
+    return to_compact_frame(counts)
@@ -0,0 +1,34 @@
+from datetime import date
+
+import pandas as pd
+
+from aggregate_service import AggregateClient, AggregateService
+from hlr_frame import to_compact_frame
+
+class SqlShapedSource:
+    # Frames as data_access.get_summary returns them, after to_compact_frame
+    name = 'sql'
+
+    def watermark(self):
+        return (1, 4)
+
+    def summary(self, start_date=None, end_date=None, operation_filter=None, file_filter=None):
+        frames = {
+            'daily': pd.DataFrame({'date': [date(2025, 7, 13)], 'operation': ['SIMREG'], 'count': [4]}),
+            'hourly': pd.DataFrame({'hour': [10], 'count': [4]}),
+            'status': pd.DataFrame({'operation': ['SIMREG', 'SIMREG'], 'hlr_found': [1, 0], 'count': [3, 1]}),
+            'files': pd.DataFrame({'file_name': ['hlrout_2025-07-13_10-45.txt'], 'count': [4]}),
+            'recon': pd.DataFrame({'operation': ['SIMREG', 'SIMREG'], 'recon_status': [0, 1], 'count': [3, 1]}),
+        }
+        return {name: to_compact_frame(frame) for name, frame in frames.items()}
+
+def test_sql_summary_round_trip():
+    client = AggregateClient(service=AggregateService(SqlShapedSource()))
+    for _ in range(2):
+        # The second call is answered with a 304 and served from the client's copy
+        summary = client.summary()
+        assert summary['metrics'] == {'total': 4, 'found': 3, 'not_found': 1, 'success_rate': 75.0,
+                                      'operations': {'SIMREG': 4}}
+        assert list(summary['recon']['recon_status']) == ['matched', 'missing_in_hlr']
+        assert list(summary['daily']['date']) == [date(2025, 7, 13)]
+        assert list(summary['status']['hlr_found']) == [True, False]
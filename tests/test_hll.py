@@ -0,0 +1,32 @@
+from hll import HyperLogLog
+
+def numbers(start, count):
+    return [str(60100000000 + value) for value in range(start, start + count)]
+
+def test_estimate_is_within_the_standard_error():
+    for count in (1000, 50000):
+        sketch = HyperLogLog().add(numbers(0, count))
+        # Four standard errors, so the check does not depend on the hash being kind to this range
+        assert abs(sketch.estimate() - count) <= 4 * sketch.relative_error * count
+
+def test_small_counts_are_near_exact():
+    assert HyperLogLog().estimate() == 0
+    assert HyperLogLog().add(numbers(0, 10)).estimate() == 10
+
+def test_duplicates_and_empty_values_count_once():
+    sketch = HyperLogLog().add(numbers(0, 100) * 5 + ['', None])
+    assert sketch.estimate() == HyperLogLog().add(numbers(0, 100)).estimate()
+
+def test_merge_matches_the_sketch_of_the_union():
+    left = HyperLogLog().add(numbers(0, 30000))
+    right = HyperLogLog().add(numbers(20000, 30000))
+    union = HyperLogLog().add(numbers(0, 50000))
+    assert (left.merge(right).registers == union.registers).all()
+    # Merging is idempotent, so a file merged twice counts nothing twice
+    assert (left.merge(right).registers == union.registers).all()
+
+def test_bytes_round_trip():
+    sketch = HyperLogLog().add(numbers(0, 5000) + ['502195539415819', 'not a number'])
+    restored = HyperLogLog.from_bytes(sketch.to_bytes())
+    assert (restored.registers == sketch.registers).all()
+    assert restored.estimate() == sketch.estimate()
@@ -0,0 +1,84 @@
+from hlr_decoder import (LINE_PATTERN, RECON_IMSI_MISMATCH, RECON_MATCHED, RECON_MISSING_IN_HLR,
+                         RECON_MSISDN_MISMATCH, decode_lines)
+
+NOT_FOUND = 'HLR MSISDN NO DATA FOUND'
+
+def line(operation, bss=None, hlr=None):
+    # The verify job's compact one-object-per-line format, which LINE_PATTERN matches directly
+    def side(entry):
+        return f'[{{"msisdn_no":"{entry[0]}","imsi_no":"{entry[1]}"}}]' if entry else '[]'
+    return f'{{"operation":"{operation}","BSS":{side(bss)},"HLR":{side(hlr)}}}'
+
+def test_fast_path_and_json_fallback_agree():
+    compact = [
+        line('SIMREG', ('60105211003', '502195539415819'), ('60105211003', '502195539415819')),
+        line('SIMREG', ('60108010732', '502195539415820'), (NOT_FOUND, '')),
+        line('CHANGEMSISDN', ('60192335883', '502191234567890'), None),
+        line('SIMREG', None, ('60176364408', '502191111111111')),
+    ]
+    assert all(LINE_PATTERN.fullmatch(text) for text in compact)
+    # Same objects with whitespace and reordered keys, so none of them take the fast path
+    spaced = [
+        '{"BSS": [{"imsi_no": "502195539415819", "msisdn_no": "60105211003"}], "operation": "SIMREG", '
+        '"HLR": [{"msisdn_no": "60105211003", "imsi_no": "502195539415819"}]}',
+        '{"operation": "SIMREG", "BSS": [{"msisdn_no": "60108010732", "imsi_no": "502195539415820"}], '
+        f'"HLR": [{{"msisdn_no": "{NOT_FOUND}", "imsi_no": ""}}]}}',
+        '{"operation": "CHANGEMSISDN", "BSS": [{"msisdn_no": "60192335883", "imsi_no": "502191234567890"}], '
+        '"HLR": []}',
+        '{"operation": "SIMREG", "BSS": [], "HLR": [{"msisdn_no": "60176364408", "imsi_no": "502191111111111"}]}',
+    ]
+    assert not any(LINE_PATTERN.fullmatch(text) for text in spaced)
+
+    fast, fallback = decode_lines([text.encode() for text in compact]), decode_lines(spaced)
+    assert fast.columns() == fallback.columns()
+    assert fast.hlr_found == [True, False, False, True]
+    for batch in (fast, fallback):
+        assert (batch.lines, batch.malformed, batch.empty_bss, batch.empty_hlr) == (4, 0, 1, 1)
+
+def test_malformed_lines_are_counted_not_raised():
+    good = line('SIMREG', ('60105211003', '502195539415819'), ('60105211003', '502195539415819'))
+    batch = decode_lines([
+        good,
+        '',
+        '   ',
+        '{"operation":"SIMREG","BSS":[',
+        '{"BSS": [], "HLR": []}',
+        '{"operation": null, "BSS": [], "HLR": []}',
+        '{"operation": "", "BSS": [], "HLR": []}',
+        '{"operation": "SIMREG", "BSS": [{"msisdn_no": 6.01e10}], "HLR": []}',
+        '{"operation": "SIMREG", "BSS": {"msisdn_no": "601"}, "HLR": []}',
+        '[1, 2]',
+        b'\xff\xfe',
+    ])
+    # Blank lines are skipped outright; everything else that is not a verification is malformed
+    assert batch.lines == 9
+    assert batch.malformed == 8
+    assert len(batch) == 1 and batch.operation == ['SIMREG']
+
+def test_numeric_subscriber_numbers_are_read_as_strings():
+    batch = decode_lines(['{"operation": "SIMREG", "BSS": [{"msisdn_no": 60105211003, "imsi_no": null}], '
+                          '"HLR": [{"msisdn_no": "60105211003", "imsi_no": ""}]}'])
+    assert batch.malformed == 0
+    assert (batch.bss_msisdn, batch.bss_imsi) == (['60105211003'], [''])
+    assert batch.reconcile() == [RECON_MATCHED]
+
+def test_reconciliation_rules():
+    bss = ('60105211003', '502195539415819')
+    batch = decode_lines([
+        line('SIMREG', bss, bss),
+        line('SIMREG', bss, (NOT_FOUND, '')),
+        line('SIMREG', bss, ('60100000000', bss[1])),
+        line('SIMREG', bss, (bss[0], '502190000000000')),
+        # CHANGEMSISDN expects the HLR to hold a new MSISDN for the same IMSI
+        line('CHANGEMSISDN', bss, ('60100000000', bss[1])),
+        line('CHANGEMSISDN', bss, bss),
+        line('CHANGEMSISDN', bss, ('60100000000', '502190000000000')),
+        # The most severe finding wins
+        line('SIMREG', bss, ('60100000000', '502190000000000')),
+        line('SIMREG', bss, None),
+    ])
+    assert batch.reconcile() == [
+        RECON_MATCHED, RECON_MISSING_IN_HLR, RECON_MSISDN_MISMATCH, RECON_IMSI_MISMATCH,
+        RECON_MATCHED, RECON_MSISDN_MISMATCH, RECON_IMSI_MISMATCH,
+        RECON_IMSI_MISMATCH, RECON_MISSING_IN_HLR,
+    ]
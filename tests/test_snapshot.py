@@ -0,0 +1,87 @@
+import gzip
+import json
+import os
+
+import snapshot
+
+NOT_FOUND = 'HLR MSISDN NO DATA FOUND'
+
+def rows(first_id, count, day, file_name='hlrout_2025-07-01_10-00.txt', source='default'):
+    # Tuples in SNAPSHOT_COLUMNS order; every third one has no HLR data
+    return [(record_id, 'SIMREG', str(60100000000 + record_id), str(502190000000000 + record_id),
+             NOT_FOUND if record_id % 3 == 0 else str(60100000000 + record_id), '', source, file_name,
+             f"{day} 10:00:00")
+            for record_id in range(first_id, first_id + count)]
+
+def snapshot_ids(root):
+    return sorted(snapshot.load_table(root)['id'].to_pylist())
+
+def total_count(root):
+    return int(snapshot.load_counts(root)['count'].sum())
+
+def test_append_writes_one_segment_per_day_with_its_counts(tmp_path):
+    manifest = snapshot.load_manifest(tmp_path)
+    added = snapshot.append_rows(manifest, rows(1, 4, '2025-07-01') + rows(5, 2, '2025-07-02'), tmp_path)
+    snapshot.save_manifest(manifest, tmp_path)
+
+    assert added == ['2025-07-01/000000000001-000000000004.arrow', '2025-07-02/000000000005-000000000006.arrow']
+    assert manifest['segments'][0]['counts'] == [['hlrout_2025-07-01_10-00.txt', 'SIMREG', False, 1],
+                                                 ['hlrout_2025-07-01_10-00.txt', 'SIMREG', True, 3]]
+    assert snapshot_ids(tmp_path) == [1, 2, 3, 4, 5, 6]
+    assert total_count(tmp_path) == 6
+
+def test_compact_merges_closed_days_and_keeps_today_until_the_limit(tmp_path):
+    manifest = snapshot.load_manifest(tmp_path)
+    for first_id in (1, 11, 21):
+        snapshot.append_rows(manifest, rows(first_id, 5, '2025-07-01') + rows(first_id + 5, 5, '2025-07-02'), tmp_path)
+
+    added, removed = snapshot.compact(manifest, tmp_path, compact_after=3, today='2025-07-02')
+    snapshot.save_manifest(manifest, tmp_path)
+
+    assert added == ['2025-07-01/000000000001-000000000025.arrow']
+    assert len(removed) == 3 and not any(os.path.exists(tmp_path / path) for path in removed)
+    assert [segment['day'] for segment in manifest['segments']].count('2025-07-02') == 3
+    assert snapshot_ids(tmp_path) == list(range(1, 31))
+    assert total_count(tmp_path) == 30
+
+    # Past compact_after, today's segments are merged too
+    snapshot.append_rows(manifest, rows(31, 5, '2025-07-02'), tmp_path)
+    snapshot.compact(manifest, tmp_path, compact_after=3, today='2025-07-02')
+    snapshot.save_manifest(manifest, tmp_path)
+    assert [segment['path'] for segment in manifest['segments']] == [
+        '2025-07-01/000000000001-000000000025.arrow', '2025-07-02/000000000006-000000000035.arrow']
+    assert snapshot_ids(tmp_path) == list(range(1, 36))
+
+def test_compact_rewrites_legacy_ndjson_segments(tmp_path):
+    records = [dict(zip(snapshot.SNAPSHOT_COLUMNS, row)) for row in rows(1, 3, '2025-07-01')]
+    for record in records:
+        del record['source']
+    relative = '2025-07-01/000000000001-000000000003.ndjson.gz'
+    os.makedirs(tmp_path / '2025-07-01')
+    with gzip.open(tmp_path / relative, 'wt') as f:
+        f.writelines(json.dumps(record) + '\n' for record in records)
+    manifest = {'version': 1, 'segments': [{'path': relative, 'day': '2025-07-01', 'rows': 3, 'min_id': 1,
+                                            'max_id': 3}]}
+    snapshot.save_manifest(manifest, tmp_path)
+    assert total_count(tmp_path) == 3
+
+    added, removed = snapshot.compact(manifest, tmp_path, today='2025-07-01')
+    snapshot.save_manifest(manifest, tmp_path)
+    assert (added, removed) == (['2025-07-01/000000000001-000000000003.arrow'], [relative])
+    assert 'counts' in manifest['segments'][0]
+    assert snapshot_ids(tmp_path) == [1, 2, 3]
+
+def test_drop_file_removes_only_that_source_and_file(tmp_path):
+    manifest = snapshot.load_manifest(tmp_path)
+    snapshot.append_rows(manifest, rows(1, 4, '2025-07-01', 'a.txt') + rows(5, 4, '2025-07-01', 'b.txt')
+                         + rows(9, 4, '2025-07-01', 'a.txt', source='east') + rows(13, 2, '2025-07-02', 'a.txt'),
+                         tmp_path)
+
+    added, removed = snapshot.drop_file(manifest, 'default', 'a.txt', tmp_path)
+    snapshot.save_manifest(manifest, tmp_path)
+
+    assert added == ['2025-07-01/000000000005-000000000012.arrow']
+    assert sorted(removed) == ['2025-07-01/000000000001-000000000012.arrow',
+                               '2025-07-02/000000000013-000000000014.arrow']
+    assert snapshot_ids(tmp_path) == list(range(5, 13))
+    assert total_count(tmp_path) == 8